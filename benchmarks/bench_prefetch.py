@@ -0,0 +1,112 @@
+"""Compare playlist wall time with and without per-entry metadata prefetch.
+
+Uses the stand-in yt-dlp from benchmarks/fakes, which spends the recorded
+entry_resolve_delay extracting every playlist entry. Three runs over the same
+playlist: one yt-dlp process for the whole list (how playlists were downloaded
+before entries became separate jobs), the engine with YTD_PREFETCH_WORKERS=0,
+and the engine with prefetch. Entries are recorded as mp4 so no transcode runs.
+
+    python benchmarks/bench_prefetch.py --entries 40 --jobs 3
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import run as suite
+from throttled_server import ThrottledServer
+
+
+def make_recording(work_dir, entries, entry_delay):
+    with open(suite.recording_path("playlist"), "r", encoding="utf-8") as f:
+        recording = json.load(f)
+    recording["playlist"]["count"] = entries
+    recording["playlist"]["entry"]["ext"] = "mp4"
+    recording["entry_resolve_delay"] = entry_delay
+    path = os.path.join(work_dir, "playlist.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False)
+    return path
+
+
+def run_single_process(work_dir, url):
+    from ytd_engine import FILE_EVENT_TEMPLATE, PROGRESS_EVENT_TEMPLATE
+
+    yt_dlp = os.path.join(suite.FAKES_DIR, "yt-dlp")
+    out_dir = suite.job_dir(work_dir, "single")
+    t0 = time.perf_counter()
+    info = subprocess.run([sys.executable, yt_dlp, "-J", "--flat-playlist", url], capture_output=True, text=True, check=True)
+    info_path = os.path.join(work_dir, "playlist.info.json")
+    with open(info_path, "w", encoding="utf-8") as f:
+        f.write(info.stdout)
+    subprocess.run(
+        [
+            sys.executable, yt_dlp,
+            "-o", os.path.join(out_dir, "%(title)s.%(ext)s"),
+            "--progress-template", PROGRESS_EVENT_TEMPLATE,
+            "--print", FILE_EVENT_TEMPLATE,
+            "--load-info-json", info_path,
+        ],
+        capture_output=True, text=True, check=True,
+    )
+    return time.perf_counter() - t0
+
+
+def run_engine(work_dir, url, name, jobs, prefetch_workers):
+    os.environ["YTD_PREFETCH_WORKERS"] = str(prefetch_workers)
+    engine = suite.make_engine(work_dir, max_jobs=jobs)
+    out_dir = suite.job_dir(work_dir, name)
+    t0 = time.perf_counter()
+    parent = engine.submit(url, download_path=out_dir)
+    engine.wait()
+    wall = time.perf_counter() - t0
+    children = [j for j in engine.scheduler.jobs.values() if j.parent_id == parent.id]
+    failed = [j for j in children if j.state != "done"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个任务失败: {failed[0].error}")
+    return wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=40)
+    parser.add_argument("--entry-delay", type=float, default=0.6, help="每项的提取耗时（秒）")
+    parser.add_argument("--jobs", type=int, default=3, help="同时下载数")
+    parser.add_argument("--prefetch-workers", type=int, default=4)
+    parser.add_argument("--per-host", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="ytd-prefetch-")
+    server = ThrottledServer(rate=32 * 1024 * 1024, max_connections=64)
+    server.start()
+    suite.setup_env(work_dir, server.base_url, 1.0)
+    os.environ["YTD_BENCH_RECORDING"] = make_recording(work_dir, args.entries, args.entry_delay)
+    os.environ["YTD_PREFETCH_PER_HOST"] = str(args.per_host)
+    url = "https://www.youtube.com/playlist?list=PLbench"
+    try:
+        single = run_single_process(work_dir, url)
+        plain = run_engine(work_dir, url, "plain", args.jobs, 0)
+        prefetch = run_engine(work_dir, url, "prefetch", args.jobs, args.prefetch_workers)
+    finally:
+        server.stop()
+        os.environ.pop("YTD_PREFETCH_WORKERS", None)
+        os.environ.pop("YTD_PREFETCH_PER_HOST", None)
+        tempfile.tempdir = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.entries} 项播放列表，每项提取 {args.entry_delay:.1f} 秒，同时下载 {args.jobs}")
+    print(f"单进程 yt-dlp：        {single:6.1f} 秒")
+    print(f"逐项任务（无预取）：   {plain:6.1f} 秒（{single / plain:.2f}x）")
+    print(
+        f"逐项任务 + 预取 {args.prefetch_workers}/{args.per_host}：{prefetch:6.1f} 秒（{single / prefetch:.2f}x，"
+        f"比无预取快 {plain / prefetch:.2f}x）"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
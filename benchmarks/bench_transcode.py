@@ -0,0 +1,88 @@
+"""Compare single-process and segmented CPU transcoding on one input file.
+
+Both use the CPU encode profile the engine would pick for the input (see
+``main.py --calibrate-encoders``).
+
+    python benchmarks/bench_transcode.py input.webm --segments 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ytd_engine import DownloadEngine, DownloadJob, TranscodeProgress  # noqa: E402
+
+
+def run_single(engine, job, ffmpeg_exe, input_file, output_file, probe, profile):
+    cmd, _, _ = engine._build_transcode_cmd(
+        ffmpeg_exe, input_file, output_file, prefer_hw=False, probe=probe, cpu_profile=profile
+    )
+    progress = TranscodeProgress(input_file, profile.name, probe["duration"])
+    if engine._run_ffmpeg(job, cmd, progress) != 0:
+        return None
+    return progress
+
+
+def run_segmented(engine, job, ffmpeg_exe, input_file, output_file, probe, segments, profile):
+    _, copy_audio = engine._plan_stream_copy(probe)
+    return engine._transcode_segmented(job, ffmpeg_exe, input_file, output_file, probe, copy_audio, segments, profile)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input")
+    parser.add_argument("--segments", type=int, default=max(2, (os.cpu_count() or 2) // 2))
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = DownloadEngine(is_debug=args.verbose)
+    engine.add_listener(lambda event, job, data: print(data["message"]) if "message" in data else None)
+    ffmpeg_exe = engine.get_ffmpeg_executable()
+    if not ffmpeg_exe:
+        print("未找到 ffmpeg", file=sys.stderr)
+        return 2
+    probe = engine._probe_media(ffmpeg_exe, args.input)
+    if not probe or not probe["duration"] or not probe["video"]:
+        print("无法探测输入视频时长", file=sys.stderr)
+        return 2
+
+    profile = engine.get_cpu_encode_profile(ffmpeg_exe, probe)
+    print(f"编码配置: {profile.name}（{profile.reason}）")
+
+    work_dir = tempfile.mkdtemp(prefix="ytd-bench-")
+    job = DownloadJob(args.input, work_dir)
+    results = {}
+    try:
+        for name, runner in (
+            ("single", lambda out: run_single(engine, job, ffmpeg_exe, args.input, out, probe, profile)),
+            ("segmented", lambda out: run_segmented(
+                engine, job, ffmpeg_exe, args.input, out, probe, args.segments, profile
+            )),
+        ):
+            output_file = os.path.join(work_dir, f"{name}.mp4")
+            t0 = time.perf_counter()
+            progress = runner(output_file)
+            elapsed = time.perf_counter() - t0
+            if progress is None:
+                print(f"{name}: 转码失败")
+                continue
+            ok, message = engine._verify_transcode(ffmpeg_exe, output_file, probe)
+            results[name] = elapsed
+            print(
+                f"{name}: {elapsed:.2f} 秒，{probe['duration'] / elapsed:.2f}x 实时，"
+                f"{os.path.getsize(output_file) / 1024 / 1024:.1f} MiB，校验{'通过' if ok else '失败'}（{message}）"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if len(results) == 2:
+        print(f"加速比: {results['single'] / results['segmented']:.2f}x（{args.segments} 段，{os.cpu_count()} 核）")
+    return 0 if len(results) == 2 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
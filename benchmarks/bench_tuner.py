@@ -0,0 +1,87 @@
+"""Check that the download tuner converges against the local throttled HLS server.
+
+Each round downloads the same playlist; the tuning history starts empty and
+is kept across rounds. Prints the settings the tuner picked and the measured speed;
+only rounds that downloaded something count towards convergence.
+
+    python benchmarks/bench_tuner.py --rounds 12 --max-connections 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from throttled_server import ThrottledServer, parse_size  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--segments", type=int, default=24)
+    parser.add_argument("--segment-size", default="256K")
+    parser.add_argument("--rate", default="1M")
+    parser.add_argument("--max-connections", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="ytd-tuner-")
+    os.environ["XDG_DATA_HOME"] = work_dir
+    os.environ["APPDATA"] = work_dir
+    os.environ["YTD_ARCHIVE"] = "0"
+    os.environ["YTD_TRANSCODE_CACHE_MB"] = "0"
+    os.environ.pop("YTD_TUNE", None)
+
+    from ytd_engine import DownloadEngine
+
+    server = ThrottledServer(
+        segments=args.segments,
+        segment_bytes=parse_size(args.segment_size),
+        rate=parse_size(args.rate),
+        max_connections=args.max_connections,
+    )
+    url = server.start()
+    engine = DownloadEngine(download_path=work_dir, max_jobs=1)
+    engine.start_warmup()
+    engine.wait_ready()
+
+    picks = []
+    try:
+        for round_no in range(1, args.rounds + 1):
+            tuning = engine.get_download_tuning(url)
+            rejected = server.rejected
+            round_dir = os.path.join(work_dir, f"round{round_no}")
+            os.makedirs(round_dir, exist_ok=True)
+            job = engine.submit(url, download_path=round_dir)
+            engine.wait()
+            seconds = (job.finished_at or 0) - (job.started_at or job.created_at)
+            # A failed round (no yt-dlp, server down) says nothing about the tuner.
+            if job.state == "done" and job.transferred_bytes > 0:
+                picks.append(tuning.key)
+            print(
+                f"第 {round_no:2d} 轮：分片并发 {tuning.fragments:2d}，缓冲 {tuning.buffer_size:>4}（{tuning.reason}），"
+                f"{job.state}，{job.transferred_bytes / max(seconds, 1e-6) / 1024 / 1024:.2f} MiB/s，"
+                f"被限流 {server.rejected - rejected} 次",
+                flush=True,
+            )
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if len(picks) < 3:
+        print(f"只有 {len(picks)}/{args.rounds} 轮下载成功，无法判断是否收敛")
+        return 2
+    # Buffer sizes perform about the same on loopback, so convergence is judged
+    # on the fragment count, which is what the server throttles.
+    tail = picks[-3:]
+    fragments = {key.split("/")[0] for key in tail}
+    if len(fragments) == 1:
+        print(f"已收敛：分片并发 {fragments.pop()}，最后三轮 {', '.join(tail)}（服务器并发上限 {args.max_connections}）")
+        return 0
+    print(f"未收敛，最后三轮：{', '.join(tail)}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""Reproducible benchmark suite for the download engine.
+
+Runs the engine against the stand-in yt-dlp/ffmpeg in benchmarks/fakes, which
+replay the recordings in benchmarks/recordings, and a local media server, then
+compares the numbers with a stored baseline in benchmarks/baselines.
+
+    python benchmarks/run.py                          # compare with baselines/default.json
+    python benchmarks/run.py --save-baseline default  # store the current numbers
+    python benchmarks/run.py --only resolve,transcode
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from throttled_server import ThrottledServer  # noqa: E402
+
+FAKES_DIR = os.path.join(HERE, "fakes")
+RECORDINGS_DIR = os.path.join(HERE, "recordings")
+BASELINES_DIR = os.path.join(HERE, "baselines")
+
+# name -> (label, unit, higher is better)
+METRICS = {
+    "resolve_video_ms": ("单个视频解析延迟", "ms", False),
+    "resolve_playlist_ms": ("300 项播放列表解析延迟", "ms", False),
+    "playlist_first_entry_ms": ("播放列表首项延迟", "ms", False),
+    "read_loop_lines_per_sec": ("下载输出读取", "行/秒", True),
+    "log_emit_lines_per_sec": ("日志投递", "行/秒", True),
+    "log_panel_lines_per_sec": ("日志面板刷新", "行/秒", True),
+    "job_wall_seconds": ("6 个任务端到端", "秒", False),
+    "transcode_realtime": ("转码吞吐", "x 实时", True),
+    "audio_only_bytes_percent": ("仅音频传输量（占完整下载）", "%", False),
+}
+GROUPS = {
+    "resolve": ("resolve_video_ms", "resolve_playlist_ms", "playlist_first_entry_ms"),
+    "log": ("read_loop_lines_per_sec", "log_emit_lines_per_sec", "log_panel_lines_per_sec"),
+    "jobs": ("job_wall_seconds",),
+    "transcode": ("transcode_realtime",),
+    "audio": ("audio_only_bytes_percent",),
+}
+
+
+def recording_path(name):
+    return os.path.join(RECORDINGS_DIR, f"{name}.json")
+
+
+def setup_env(work_dir, media_url, speed):
+    os.environ["PATH"] = FAKES_DIR + os.pathsep + os.environ.get("PATH", "")
+    os.environ["XDG_DATA_HOME"] = work_dir
+    os.environ["APPDATA"] = work_dir
+    os.environ["YTD_BENCH_MEDIA_URL"] = media_url
+    os.environ["YTD_BENCH_SPEED"] = str(speed)
+    os.environ["YTD_BENCH_RECORDING"] = recording_path("video")
+    os.environ["YTD_ARCHIVE"] = "0"
+    os.environ["YTD_TRANSCODE_CACHE_MB"] = "0"
+    os.environ["YTD_TUNE"] = "0"
+    os.environ["YTD_TRANSCODE_SEGMENTS"] = "0"
+    os.environ.pop("YTD_RATE_LIMIT", None)
+    os.environ.pop("YTD_BENCH_FLOOD", None)
+    # Keep the staged tools and encoder cache out of the real temp dir.
+    tempfile.tempdir = work_dir
+
+
+def make_engine(work_dir, **kwargs):
+    from ytd_engine import DownloadEngine
+
+    engine = DownloadEngine(download_path=work_dir, **kwargs)
+    engine.start_warmup()
+    engine.wait_ready()
+    engine.wait_warmup()
+    return engine
+
+
+def job_dir(work_dir, name):
+    path = os.path.join(work_dir, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def bench_resolve(work_dir, recording, runs=5):
+    """Median (total, first entry) resolve latency in ms; entries are not queued."""
+    from ytd_engine import DownloadJob
+
+    os.environ["YTD_BENCH_RECORDING"] = recording_path(recording)
+    engine = make_engine(work_dir)
+    totals = []
+    firsts = []
+    for i in range(runs):
+        job = DownloadJob(f"https://www.youtube.com/playlist?list=bench{i}", work_dir)
+        first = []
+        t0 = time.perf_counter()
+        engine._fetch_media_info(job.url, job, on_entry=lambda entry: first or first.append(time.perf_counter()))
+        totals.append((time.perf_counter() - t0) * 1000)
+        if first:
+            firsts.append((first[0] - t0) * 1000)
+    os.environ["YTD_BENCH_RECORDING"] = recording_path("video")
+    return statistics.median(totals), (statistics.median(firsts) if firsts else None)
+
+
+def bench_read_loop(work_dir, lines=200000):
+    # Recorded delays are scaled away so the job time is dominated by the flood.
+    speed = os.environ["YTD_BENCH_SPEED"]
+    os.environ["YTD_BENCH_FLOOD"] = str(lines)
+    os.environ["YTD_BENCH_SPEED"] = "1000000"
+    try:
+        engine = make_engine(work_dir)
+        job = engine.submit("https://www.youtube.com/watch?v=bench0001", download_path=job_dir(work_dir, "flood"))
+        engine.wait()
+    finally:
+        os.environ.pop("YTD_BENCH_FLOOD", None)
+        os.environ["YTD_BENCH_SPEED"] = speed
+    if job.state != "done":
+        raise RuntimeError(f"任务失败: {job.error}")
+    return lines / (job.finished_at - job.started_at)
+
+
+def bench_log_emit(work_dir, lines=100000):
+    from ytd_engine import DownloadEngine
+
+    engine = DownloadEngine(download_path=work_dir)
+    log_queue = queue.Queue()
+    # Same work as VideoDownloader.log: timestamp at production time, then enqueue.
+    engine.add_listener(
+        lambda event, job, data: log_queue.put(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {data['message']}")
+    )
+    t0 = time.perf_counter()
+    for i in range(lines):
+        engine.log(f"[#1] [download]  {i % 100}.0% of 10.00MiB at 2.00MiB/s ETA 00:05")
+    return lines / (time.perf_counter() - t0)
+
+
+def bench_log_panel(lines=20000):
+    try:
+        import tkinter as tk
+        from tkinter import scrolledtext
+        root = tk.Tk()
+    except Exception:
+        return None
+    from ytd_gui import VideoDownloader
+
+    root.withdraw()
+
+    class Panel:
+        pass
+
+    panel = Panel()
+    panel.root = type("Root", (), {"after": staticmethod(lambda *args: None)})()
+    panel.log_queue = queue.Queue()
+    panel.log_text = scrolledtext.ScrolledText(root)
+    panel.log_max_lines = 5000
+    panel.log_batch_lines = 500
+    for i in range(lines):
+        panel.log_queue.put(f"2025-01-01 00:00:00 - [#1] line {i}")
+    t0 = time.perf_counter()
+    while not panel.log_queue.empty():
+        VideoDownloader._process_log_queue(panel)
+        root.update_idletasks()
+    elapsed = time.perf_counter() - t0
+    root.destroy()
+    return lines / elapsed
+
+
+def bench_jobs(work_dir, jobs=6, max_jobs=3):
+    engine = make_engine(work_dir, max_jobs=max_jobs)
+    t0 = time.perf_counter()
+    submitted = [
+        engine.submit(f"https://www.youtube.com/watch?v=bench{i}", download_path=job_dir(work_dir, f"job{i}"))
+        for i in range(jobs)
+    ]
+    engine.wait()
+    wall = time.perf_counter() - t0
+    failed = [j for j in submitted if j.state != "done"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个任务失败: {failed[0].error}")
+    return wall
+
+
+def bench_transcode(work_dir, size=4 * 1024 * 1024):
+    from ytd_engine import DownloadJob
+
+    engine = make_engine(work_dir)
+    input_file = os.path.join(job_dir(work_dir, "transcode"), "input.webm")
+    with open(input_file, "wb") as f:
+        f.write(os.urandom(size))
+    job = DownloadJob("bench", os.path.dirname(input_file))
+    t0 = time.perf_counter()
+    output = engine.convert_to_mp4(job, input_file)
+    wall = time.perf_counter() - t0
+    if output == input_file:
+        raise RuntimeError("转码失败")
+    with open(recording_path("video"), "r", encoding="utf-8") as f:
+        duration = json.load(f)["ffmpeg"]["duration"]
+    return duration / wall
+
+
+def bench_audio_only(work_dir):
+    """Bytes an audio-only job moves, as a percentage of the full download of the same video."""
+    engine = make_engine(work_dir)
+    url = "https://www.youtube.com/watch?v=bench0001"
+    video = engine.submit(url, download_path=job_dir(work_dir, "full"))
+    audio = engine.submit(url, download_path=job_dir(work_dir, "audio"), audio_only=True)
+    engine.wait()
+    for job in (video, audio):
+        if job.state != "done" or not job.files:
+            raise RuntimeError(f"任务 #{job.id} 未完成: {job.error}")
+    if audio.files[0].lower().endswith(".mp4"):
+        raise RuntimeError(f"仅音频任务输出了视频: {audio.files[0]}")
+    return audio.transferred_bytes * 100 / video.transferred_bytes
+
+
+def run_suite(groups, speed):
+    work_dir = tempfile.mkdtemp(prefix="ytd-bench-")
+    server = ThrottledServer(rate=32 * 1024 * 1024, max_connections=64)
+    server.start()
+    setup_env(work_dir, server.base_url, speed)
+    results = {}
+    try:
+        if "resolve" in groups:
+            results["resolve_video_ms"] = bench_resolve(work_dir, "video")[0]
+            results["resolve_playlist_ms"], results["playlist_first_entry_ms"] = bench_resolve(work_dir, "playlist")
+        if "log" in groups:
+            results["read_loop_lines_per_sec"] = bench_read_loop(work_dir)
+            results["log_emit_lines_per_sec"] = bench_log_emit(work_dir)
+            results["log_panel_lines_per_sec"] = bench_log_panel()
+        if "jobs" in groups:
+            results["job_wall_seconds"] = bench_jobs(work_dir)
+        if "transcode" in groups:
+            results["transcode_realtime"] = bench_transcode(work_dir)
+        if "audio" in groups:
+            results["audio_only_bytes_percent"] = bench_audio_only(work_dir)
+    finally:
+        server.stop()
+        tempfile.tempdir = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'指标':<24}{'基线':>14}{'本次':>14}{'变化':>10}")
+    for name, value in results.items():
+        label, unit, higher_is_better = METRICS[name]
+        base = (baseline or {}).get(name)
+        cell = f"{value:.1f}" if value is not None else "跳过"
+        if value is None or base is None:
+            print(f"{label:<20}{'-':>14}{cell:>14} {unit}")
+            continue
+        change = (value - base) / base if base else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  退步" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{label:<20}{base:>14.1f}{cell:>14}{change * 100:>+9.1f}% {unit}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"逗号分隔：{','.join(GROUPS)}")
+    parser.add_argument("--baseline", default="default", help="对比的基线名称（baselines/<名称>.json）")
+    parser.add_argument("--save-baseline", metavar="NAME", default=None, help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="超过该比例的变差视为退步（默认 0.15）")
+    parser.add_argument("--speed", type=float, default=1.0, help="录制延迟的回放倍速")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有退步时以退出码 1 结束")
+    args = parser.parse_args(argv)
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        parser.error(f"未知的基准组: {', '.join(unknown)}")
+
+    results = run_suite(groups, args.speed)
+
+    baseline_path = os.path.join(BASELINES_DIR, f"{args.baseline}.json")
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        baseline = stored.get("metrics")
+        if stored.get("machine") != machine_info():
+            print(f"注意：基线来自不同的机器（{stored.get('machine')}）")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        path = os.path.join(BASELINES_DIR, f"{args.save_baseline}.json")
+        merged = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                merged = json.load(f).get("metrics") or {}
+        merged.update({k: (round(v, 3) if v is not None else None) for k, v in results.items()})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"saved": datetime.now().isoformat(timespec="seconds"), "speed": args.speed,
+                 "machine": machine_info(), "metrics": merged},
+                f, ensure_ascii=False, indent=2,
+            )
+            f.write("\n")
+        print(f"基线已保存: {path}")
+
+    if regressions:
+        print(f"退步: {', '.join(regressions)}")
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
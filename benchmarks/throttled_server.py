@@ -0,0 +1,170 @@
+"""Local HLS server with a per-connection rate limit and a cap on concurrent segment requests.
+
+Requests over the cap get HTTP 429, like hosts that throttle aggressive fragment downloads.
+/media/<name>?size=N serves N bytes as a plain progressive file at the same rate.
+
+    python benchmarks/throttled_server.py --max-connections 4 --rate 1M
+"""
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TS_PACKET = b"\x47\x1f\xff\x10" + b"\xff" * 184
+
+
+def parse_size(text):
+    text = str(text).strip().upper()
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        owner = self.server.owner
+        path, _, query = self.path.partition("?")
+        if path.endswith(".m3u8"):
+            body = owner.playlist().encode("ascii")
+            self._headers(200, "application/vnd.apple.mpegurl", len(body))
+            self.wfile.write(body)
+            return
+        if path.startswith("/seg") and path.endswith(".ts"):
+            if not owner.acquire():
+                self._headers(429, "text/plain", 0, {"Retry-After": "1"})
+                return
+            try:
+                self._headers(200, "video/mp2t", len(owner.segment))
+                owner.send_throttled(self.wfile, owner.segment)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                owner.release()
+            return
+        if path.startswith("/media/"):
+            params = dict(p.partition("=")[::2] for p in query.split("&") if p)
+            try:
+                size = parse_size(params.get("size", "1M"))
+            except ValueError:
+                size = 0
+            self._headers(200, "application/octet-stream", size)
+            try:
+                owner.send_throttled(self.wfile, owner.media_bytes(size))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return
+        self._headers(404, "text/plain", 0)
+
+    def _headers(self, status, content_type, length, extra=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for key, value in (extra or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+
+class ThrottledServer:
+    def __init__(self, segments=40, segment_bytes=512 * 1024, rate=1024 * 1024, max_connections=4,
+                 host="127.0.0.1", port=0):
+        self.segments = segments
+        self.segment = TS_PACKET * max(1, segment_bytes // len(TS_PACKET))
+        self.rate = rate
+        self.max_connections = max_connections
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), ThrottledHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self):
+        return f"{self.base_url}/video.m3u8"
+
+    def playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.segments):
+            lines += ["#EXTINF:4.0,", f"seg{i}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def media_bytes(self, size):
+        data = self.segment * (size // len(self.segment) + 1)
+        return data[:size]
+
+    def acquire(self):
+        with self._lock:
+            self.requests += 1
+            if self.active >= self.max_connections:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def send_throttled(self, wfile, data, chunk=16 * 1024):
+        started = time.perf_counter()
+        sent = 0
+        while sent < len(data):
+            wfile.write(data[sent:sent + chunk])
+            sent += chunk
+            delay = sent / self.rate - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--segments", type=int, default=40)
+    parser.add_argument("--segment-size", default="512K")
+    parser.add_argument("--rate", default="1M", help="每个连接的速度上限（字节/秒）")
+    parser.add_argument("--max-connections", type=int, default=4)
+    args = parser.parse_args(argv)
+    server = ThrottledServer(
+        segments=args.segments,
+        segment_bytes=parse_size(args.segment_size),
+        rate=parse_size(args.rate),
+        max_connections=args.max_connections,
+        port=args.port,
+    )
+    print(f"{server.url}（pid {os.getpid()}，Ctrl+C 退出）", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"请求 {server.requests} 次，拒绝 {server.rejected} 次")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+"""Format selection on hand-written format lists (no yt-dlp needed)."""
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from ytd_engine import MP4_COPY_AUDIO_CODECS, MP4_COPY_VIDEO_CODECS  # noqa: E402
+from ytd_formats import choose_formats  # noqa: E402
+
+DURATION = 600.0
+MIB = 1024 * 1024
+
+# What a typical 4K upload offers: VP9 at 2160p, H.264 tops out at 1080p.
+FORMATS = [
+    {"format_id": "313", "ext": "webm", "vcodec": "vp09.00.51.08", "acodec": "none",
+     "height": 2160, "fps": 30, "tbr": 12000, "protocol": "https"},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none",
+     "height": 1080, "fps": 30, "tbr": 4400, "protocol": "https"},
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2",
+     "tbr": 129, "protocol": "https"},
+    {"format_id": "251", "ext": "webm", "vcodec": "none", "acodec": "opus",
+     "tbr": 140, "protocol": "https"},
+]
+
+
+def cpu_speed(height):
+    return (1080 / max(height, 144)) ** 2
+
+
+def choose(formats=FORMATS, rate=4 * MIB, speed=cpu_speed, **caps):
+    return choose_formats(formats, DURATION, rate, speed, MP4_COPY_VIDEO_CODECS, MP4_COPY_AUDIO_CODECS, **caps)
+
+
+class ChooseFormatsTest(unittest.TestCase):
+    def test_copyable_1080p_beats_2160p_vp9_reencode(self):
+        choice = choose()
+
+        self.assertEqual(choice.spec, "137+140")
+        self.assertFalse(choice.reencode)
+        self.assertEqual(choice.transcode_seconds, 0)
+        self.assertTrue(choice.mp4_ready)
+        self.assertIn("313", choice.reason)
+
+    def test_fast_encoder_buys_the_extra_resolution(self):
+        choice = choose(speed=lambda height: 8.0)
+
+        self.assertEqual(choice.video["format_id"], "313")
+        self.assertTrue(choice.reencode)
+
+    def test_height_cap_leaves_only_the_copyable_pair(self):
+        self.assertEqual(choose(max_height=1080).spec, "137+140")
+
+    def test_slow_network_pays_for_a_reencode_at_the_same_size(self):
+        formats = FORMATS + [
+            {"format_id": "248", "ext": "webm", "vcodec": "vp9", "acodec": "none",
+             "height": 1080, "fps": 30, "tbr": 2000, "protocol": "https"},
+        ]
+
+        self.assertEqual(choose(formats, max_height=1080).spec, "137+140")
+        self.assertEqual(choose(formats, rate=64 * 1024, max_height=1080).spec, "248+140")
+
+
+if __name__ == "__main__":
+    unittest.main()
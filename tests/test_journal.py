@@ -0,0 +1,162 @@
+"""Journal replay and resume, against a temporary data directory (no yt-dlp needed)."""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from ytd_engine import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, DownloadEngine  # noqa: E402
+from ytd_journal import JobJournal  # noqa: E402
+
+
+def write_events(path, events):
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="ytd-test-")
+        self.journal_dir = os.path.join(self.work_dir, "ytd", "jobs")
+        os.makedirs(self.journal_dir)
+        self.journal_path = os.path.join(self.journal_dir, "journal.jsonl")
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            journal.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def open_journal(self):
+        journal = JobJournal(self.journal_dir)
+        self.journals.append(journal)
+        return journal
+
+
+class ReplayTest(JournalTestCase):
+    def test_replay_keeps_unfinished_jobs_and_their_fields(self):
+        write_events(self.journal_path, [
+            {"ev": "submit", "job": "a", "url": "https://example.com/a", "download_path": "/d",
+             "priority": PRIORITY_HIGH, "parent": None, "audio_only": False},
+            {"ev": "submit", "job": "b", "url": "https://example.com/b", "download_path": "/d",
+             "priority": PRIORITY_LOW, "parent": "a", "audio_only": True},
+            {"ev": "state", "job": "a", "state": "downloading"},
+            {"ev": "info", "job": "a", "path": "/d/a.info.json", "t": 123.0},
+            {"ev": "file", "job": "a", "record": {"source": "/d/a.webm", "output": "ignored"}},
+            {"ev": "output", "job": "a", "source": "/d/a.webm", "output": "/d/a.mp4"},
+            {"ev": "state", "job": "b", "state": "done"},
+            {"ev": "state", "job": "unknown", "state": "downloading"},
+        ])
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"ev": "state", "job": "a", "sta')
+
+        entries = self.open_journal().replay()
+
+        self.assertEqual([e["id"] for e in entries], ["a"])
+        entry = entries[0]
+        self.assertEqual(entry["priority"], PRIORITY_HIGH)
+        self.assertEqual(entry["state"], "downloading")
+        self.assertEqual(entry["info_path"], "/d/a.info.json")
+        self.assertEqual(entry["info_time"], 123.0)
+        self.assertEqual(entry["records"]["/d/a.webm"]["output"], "/d/a.mp4")
+
+    def test_second_instance_neither_replays_nor_compacts(self):
+        write_events(self.journal_path, [
+            {"ev": "submit", "job": "a", "url": "https://example.com/a", "download_path": "/d",
+             "priority": PRIORITY_NORMAL, "parent": None, "audio_only": False},
+        ])
+        owner = self.open_journal()
+        other = self.open_journal()
+
+        self.assertTrue(owner.enabled)
+        self.assertTrue(other.busy)
+        self.assertFalse(other.enabled)
+        self.assertEqual(other.replay(), [])
+        other.compact([])
+        other.append("x", "submit", url="https://example.com/x")
+        self.assertEqual([e["id"] for e in owner.replay()], ["a"])
+
+        owner.close()
+        self.assertTrue(self.open_journal().enabled)
+
+
+class ResumeTest(JournalTestCase):
+    def setUp(self):
+        super().setUp()
+        self._env = {k: os.environ.get(k) for k in ("XDG_DATA_HOME", "APPDATA", "YTD_ARCHIVE", "YTD_PREFETCH_WORKERS")}
+        os.environ["XDG_DATA_HOME"] = self.work_dir
+        os.environ["APPDATA"] = self.work_dir
+        os.environ["YTD_ARCHIVE"] = "0"
+        os.environ["YTD_PREFETCH_WORKERS"] = "0"
+        self._tempdir = tempfile.tempdir
+        tempfile.tempdir = self.work_dir
+
+    def tearDown(self):
+        tempfile.tempdir = self._tempdir
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        super().tearDown()
+
+    def make_engine(self):
+        engine = DownloadEngine(download_path=self.work_dir)
+        self.journals.append(engine.journal)
+        # Resumed jobs must not actually run; hold them until the test is done.
+        release = threading.Event()
+        self.addCleanup(release.set)
+        engine.scheduler.runner = lambda job: release.wait(10)
+        return engine
+
+    def test_resume_keeps_priority_and_finished_outputs(self):
+        output = os.path.join(self.work_dir, "a.mp4")
+        open(output, "wb").close()
+        write_events(self.journal_path, [
+            {"ev": "submit", "job": "a", "url": "https://example.com/a", "download_path": self.work_dir,
+             "priority": PRIORITY_HIGH, "parent": None, "audio_only": False},
+            {"ev": "state", "job": "a", "state": "downloading"},
+            {"ev": "file", "job": "a", "record": {"source": os.path.join(self.work_dir, "a.webm")}},
+            {"ev": "output", "job": "a", "source": os.path.join(self.work_dir, "a.webm"), "output": output},
+            {"ev": "file", "job": "a", "record": {"source": os.path.join(self.work_dir, "gone.webm")}},
+            {"ev": "submit", "job": "b", "url": "https://example.com/b", "download_path": self.work_dir,
+             "priority": None, "parent": None, "audio_only": False},
+            {"ev": "submit", "job": "c", "url": "https://example.com/c", "download_path": self.work_dir,
+             "priority": PRIORITY_NORMAL, "parent": None, "audio_only": False},
+            {"ev": "state", "job": "c", "state": "failed"},
+        ])
+
+        jobs = self.make_engine().resume_jobs()
+
+        self.assertEqual([j.url for j in jobs], ["https://example.com/a", "https://example.com/b"])
+        high, default = jobs
+        self.assertEqual(high.priority, PRIORITY_HIGH)
+        self.assertEqual(default.priority, PRIORITY_NORMAL)
+        self.assertEqual(high.journal_id, "a")
+        self.assertEqual([r["output"] for r in high.manifest.values()], [output])
+
+        # The journal was compacted down to the resumed jobs.
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            submits = [json.loads(line)["job"] for line in f if '"submit"' in line]
+        self.assertEqual(submits, ["a", "b"])
+
+    def test_second_engine_does_not_resume_live_jobs(self):
+        write_events(self.journal_path, [
+            {"ev": "submit", "job": "a", "url": "https://example.com/a", "download_path": self.work_dir,
+             "priority": PRIORITY_NORMAL, "parent": None, "audio_only": False},
+        ])
+        self.make_engine()
+
+        self.assertEqual(self.make_engine().resume_jobs(), [])
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            self.assertIn('"job": "a"', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
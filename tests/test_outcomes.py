@@ -0,0 +1,42 @@
+"""Per-entry outcomes parsed from yt-dlp output lines (no yt-dlp needed)."""
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from ytd_engine import ENTRY_FAILED, ENTRY_SKIPPED, EntryOutcomes, parse_ytdlp_event  # noqa: E402
+
+
+def feed(outcomes, lines):
+    for line in lines:
+        outcomes.feed(line, parse_ytdlp_event(line))
+
+
+class EntryOutcomesTest(unittest.TestCase):
+    def test_archived_lines_as_yt_dlp_prints_them(self):
+        outcomes = EntryOutcomes()
+        feed(outcomes, [
+            # After extraction, with the title (which may itself contain a colon).
+            "[download] dQw4w9WgXcQ: Rick Astley - Never Gonna Give You Up: Official Video has already been "
+            "recorded in the archive",
+            # Before extraction, from the URL alone.
+            "[download] jNQXAC9IVRw: has already been recorded in the archive",
+        ])
+
+        self.assertEqual(outcomes.counts(), {ENTRY_SKIPPED: 2})
+        self.assertEqual(list(outcomes.entries), ["dQw4w9WgXcQ", "jNQXAC9IVRw"])
+
+    def test_prechecked_skips_survive_a_failed_run(self):
+        outcomes = EntryOutcomes()
+        outcomes.skip("a")
+        feed(outcomes, ["ERROR: [youtube] b: Private video. Sign in if you've been granted access to this video"])
+        outcomes.finish(1)
+
+        self.assertEqual(outcomes.counts(), {ENTRY_SKIPPED: 1, ENTRY_FAILED: 1})
+        self.assertEqual(outcomes.first_error(), "Private video. Sign in if you've been granted access to this video")
+
+
+if __name__ == "__main__":
+    unittest.main()
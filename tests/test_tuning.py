@@ -0,0 +1,57 @@
+"""Download tuner bookkeeping, against a temporary stats file (no yt-dlp needed)."""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from ytd_tuning import ERROR_RATE_LIMIT, DownloadTuner, is_download_error  # noqa: E402
+
+MIB = 1024 * 1024
+
+
+class RecordTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="ytd-test-")
+        self.path = os.path.join(self.work_dir, "tuning.json")
+        self.tuner = DownloadTuner(self.path)
+        self.tuning = self.tuner.choose("example.com")
+        self.assertIsNotNone(self.tuner.record(self.tuning, 20 * MIB, 4.0, 0, 10))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def stats(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)["hosts"]["example.com"]
+
+    def test_failure_without_transport_errors_leaves_stats_unchanged(self):
+        before = self.stats()
+        lines = [
+            "ERROR: [youtube] abc123: Private video. Sign in if you've been granted access to this video",
+            "ERROR: [youtube] abc123: The uploader has not made this video available in your country",
+        ]
+        errors = sum(1 for line in lines if is_download_error(line))
+
+        self.assertIsNone(self.tuner.record(self.tuning, 0, 1.5, errors, 0, failed=True))
+        self.assertEqual(self.stats(), before)
+
+    def test_failure_with_transport_errors_marks_the_setting_throttled(self):
+        lines = [
+            "[download] Got error: HTTP Error 403: Forbidden. Retrying fragment 3 (1/10)...",
+            "ERROR: unable to download video data: HTTP Error 429: Too Many Requests",
+        ]
+        errors = sum(1 for line in lines if is_download_error(line))
+
+        self.assertIsNotNone(self.tuner.record(self.tuning, 2 * MIB, 3.0, errors, 4, failed=True))
+        stats = self.stats()["configs"][self.tuning.key]
+        self.assertEqual(stats["runs"], 2)
+        self.assertGreater(stats["error_rate"], ERROR_RATE_LIMIT)
+
+
+if __name__ == "__main__":
+    unittest.main()
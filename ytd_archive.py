@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Audio-only downloads are archived separately so they never stand in for a
+# video download of the same entry, or the other way round.
+KIND_VIDEO = "video"
+KIND_AUDIO = "audio"
+
+SCHEMA = """
+    CREATE TABLE items (
+        extractor TEXT NOT NULL,
+        video_id TEXT NOT NULL,
+        kind TEXT NOT NULL DEFAULT 'video',
+        output_path TEXT NOT NULL,
+        size INTEGER,
+        format TEXT,
+        updated REAL NOT NULL,
+        PRIMARY KEY (extractor, video_id, kind)
+    );
+    CREATE TABLE urls (
+        url TEXT NOT NULL,
+        kind TEXT NOT NULL DEFAULT 'video',
+        extractor TEXT NOT NULL,
+        video_id TEXT NOT NULL,
+        PRIMARY KEY (url, kind)
+    );
+"""
+
+
+class DownloadArchive:
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._failed = False
+
+    def _connect(self):
+        if self._conn is not None or self._failed or not self.path:
+            return self._conn
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == 1:
+                # Everything archived before audio-only jobs existed was video.
+                conn.executescript(
+                    "ALTER TABLE items RENAME TO items_v1; ALTER TABLE urls RENAME TO urls_v1;" + SCHEMA + """
+                    INSERT INTO items (extractor, video_id, output_path, size, format, updated)
+                        SELECT extractor, video_id, output_path, size, format, updated FROM items_v1;
+                    INSERT INTO urls (url, extractor, video_id) SELECT url, extractor, video_id FROM urls_v1;
+                    DROP TABLE items_v1;
+                    DROP TABLE urls_v1;
+                    """
+                )
+            elif version != self.SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS items; DROP TABLE IF EXISTS urls;" + SCHEMA)
+            if version != self.SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                conn.commit()
+        except Exception:
+            self._failed = True
+            return None
+        self._conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        return {
+            "extractor": row[0],
+            "id": row[1],
+            "output_path": row[2],
+            "size": row[3],
+            "format": row[4],
+            "updated": row[5],
+        }
+
+    def lookup(self, extractor, video_id, kind=KIND_VIDEO):
+        if not extractor or not video_id:
+            return None
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT extractor, video_id, output_path, size, format, updated FROM items "
+                "WHERE extractor = ? AND video_id = ? AND kind = ?",
+                (extractor.lower(), video_id, kind),
+            ).fetchone()
+        return self._row(row)
+
+    def lookup_url(self, url, kind=KIND_VIDEO):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT i.extractor, i.video_id, i.output_path, i.size, i.format, i.updated "
+                "FROM urls u JOIN items i ON i.extractor = u.extractor AND i.video_id = u.video_id "
+                "AND i.kind = u.kind WHERE u.url = ? AND u.kind = ?",
+                (url, kind),
+            ).fetchone()
+        return self._row(row)
+
+    def lookup_existing(self, extractor, video_id, kind=KIND_VIDEO):
+        record = self.lookup(extractor, video_id, kind)
+        if record and os.path.exists(record["output_path"]):
+            return record
+        return None
+
+    def record(self, extractor, video_id, output_path, urls=(), size=None, fmt=None, kind=KIND_VIDEO):
+        if not extractor or not video_id or not output_path:
+            return False
+        extractor = extractor.lower()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return False
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO items (extractor, video_id, kind, output_path, size, format, updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (extractor, video_id, kind, output_path, size, fmt, time.time()),
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO urls (url, kind, extractor, video_id) VALUES (?, ?, ?, ?)",
+                        [(u, kind, extractor, video_id) for u in urls if u],
+                    )
+            except sqlite3.Error:
+                return False
+        return True
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+
+# CPU encode profiles in order of decreasing speed; the last one is what the
+# CPU fallback used before calibration existed.
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium")
+DEFAULT_PROFILE = "libx264-medium"
+PROFILE_NAMES = tuple(f"libx264-{preset}" for preset in X264_PRESETS) + ("libopenh264",)
+
+CALIBRATION_HEIGHTS = (480, 720, 1080)
+CLIP_SECONDS = 4.0
+CLIP_FPS = 30
+
+# libopenh264 has no constant-quality mode; give it roughly what x264 at
+# crf 23 produces for ordinary footage.
+OPENH264_BITRATES = ((360, "1000k"), (480, "1500k"), (720, "3000k"), (1080, "6000k"), (1440, "12000k"), (2160, "24000k"))
+
+TARGET_SPEED = "speed"
+TARGET_SIZE = "size"
+DEFAULT_TARGET = (TARGET_SPEED, 1.5)
+
+
+def profile_encoder(name):
+    return "libopenh264" if name == "libopenh264" else "libx264"
+
+
+def profile_args(name, height=None):
+    if name == "libopenh264":
+        rate = OPENH264_BITRATES[-1][1]
+        for max_height, bitrate in OPENH264_BITRATES:
+            if height and height <= max_height:
+                rate = bitrate
+                break
+        return ["-c:v", "libopenh264", "-b:v", rate, "-pix_fmt", "yuv420p"]
+    preset = name.rpartition("-")[2] if name.startswith("libx264-") else "medium"
+    return ["-c:v", "libx264", "-preset", preset, "-crf", "23", "-pix_fmt", "yuv420p"]
+
+
+def parse_target(value):
+    """``speed=2`` (at least 2x realtime, smallest output) or ``size=1.2`` (within
+    1.2x of the smallest output, fastest); anything else is the default."""
+    kind, _, amount = (value or "").strip().lower().partition("=")
+    if kind not in (TARGET_SPEED, TARGET_SIZE):
+        return DEFAULT_TARGET
+    try:
+        amount = float(amount)
+    except ValueError:
+        return DEFAULT_TARGET
+    if amount <= 0 or kind == TARGET_SIZE and amount < 1:
+        return DEFAULT_TARGET
+    return kind, amount
+
+
+def format_target(target):
+    kind, amount = target
+    if kind == TARGET_SIZE:
+        return f"体积不超过最小值的 {amount:g} 倍时取最快"
+    return f"速度不低于 {amount:g}x 实时时取体积最小"
+
+
+class EncodeProfile:
+    __slots__ = ("name", "encoder", "args", "reason", "speed")
+
+    def __init__(self, name, height=None, reason="", speed=None):
+        self.name = name
+        self.encoder = profile_encoder(name)
+        self.args = profile_args(name, height)
+        self.reason = reason
+        # Measured multiple of realtime, when calibrated.
+        self.speed = speed
+
+
+class EncoderCalibration:
+    """Measured speed and output size of each CPU encode profile, per ffmpeg build and resolution."""
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        data = None
+        if self.path:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            data = {"version": self.VERSION, "builds": {}}
+        self._data = data
+        return data
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
+
+    def store(self, key, clip, results):
+        """``results`` maps a clip height to a list of {"profile", "speed", "fps", "bitrate"} dicts."""
+        if not key:
+            return
+        with self._lock:
+            self._load()["builds"][key] = {
+                "created": time.time(),
+                "clip": clip,
+                "results": {str(height): rows for height, rows in results.items()},
+            }
+            self._save()
+
+    def get(self, key):
+        if not key:
+            return None
+        with self._lock:
+            entry = self._load()["builds"].get(key)
+        if not isinstance(entry, dict) or not isinstance(entry.get("results"), dict):
+            return None
+        return entry
+
+    @staticmethod
+    def _bucket(results, height):
+        heights = []
+        for key in results:
+            try:
+                heights.append(int(key))
+            except ValueError:
+                continue
+        if not heights:
+            return None
+        if not height:
+            return max(heights)
+        # The nearest calibrated size at or above the input, else the largest.
+        above = [h for h in heights if h >= height]
+        return min(above) if above else max(heights)
+
+    def choose(self, key, height, target=DEFAULT_TARGET):
+        entry = self.get(key)
+        if entry is None:
+            return EncodeProfile(DEFAULT_PROFILE, height, "未校准")
+        bucket = self._bucket(entry["results"], height)
+        rows = [
+            r for r in entry["results"].get(str(bucket), [])
+            if isinstance(r, dict) and r.get("profile") in PROFILE_NAMES and r.get("speed") and r.get("bitrate")
+        ]
+        if not rows:
+            return EncodeProfile(DEFAULT_PROFILE, height, "校准结果不可用")
+
+        kind, amount = target
+        if kind == TARGET_SIZE:
+            smallest = min(r["bitrate"] for r in rows)
+            fitting = [r for r in rows if r["bitrate"] <= smallest * amount]
+            best = max(fitting, key=lambda r: r["speed"])
+            reason = f"{bucket}p 校准：体积在最小值 {amount:g} 倍内最快（{best['speed']:.1f}x 实时）"
+        else:
+            fast_enough = [r for r in rows if r["speed"] >= amount]
+            if fast_enough:
+                best = min(fast_enough, key=lambda r: r["bitrate"])
+                reason = f"{bucket}p 校准：{best['speed']:.1f}x 实时，满足 {amount:g}x 中体积最小"
+            else:
+                best = max(rows, key=lambda r: r["speed"])
+                reason = f"{bucket}p 校准：没有配置达到 {amount:g}x 实时，取最快（{best['speed']:.1f}x）"
+        return EncodeProfile(best["profile"], height, reason, best["speed"])
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from ytd_calibration import CALIBRATION_HEIGHTS, CLIP_SECONDS, format_target
+from ytd_engine import (
+    DownloadEngine,
+    EVENT_LOG,
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    format_rate_limit,
+    parse_rate,
+)
+
+
+def read_urls(path):
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            lines = f.read().splitlines()
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return list(dict.fromkeys(urls))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="音视频下载器批量模式（无界面）")
+    parser.add_argument("--batch", metavar="URLS_FILE", required=True, help="每行一个链接的文本文件，'-' 表示从标准输入读取")
+    parser.add_argument("--jobs", type=int, default=None, help="同时下载数（默认 YTD_MAX_JOBS 或 3）")
+    parser.add_argument("--transcode-jobs", type=int, default=None, help="同时转码数（默认 YTD_TRANSCODE_WORKERS 或 2）")
+    parser.add_argument("--limit-rate", metavar="RATE", default=None, help="所有下载共享的总限速，如 5M（默认 YTD_RATE_LIMIT 或不限）")
+    parser.add_argument("-o", "--output", default=None, help="下载目录（默认系统下载文件夹）")
+    parser.add_argument("--audio-only", action="store_true", help="只下载音频流，不转码（保存为 m4a/opus/mp3 等）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出 yt-dlp/ffmpeg 的完整日志")
+    parser.add_argument("--summary-json", metavar="PATH", default=None, help="将批量统计写入 JSON 文件")
+    parser.add_argument("--resume", action="store_true", help="先恢复上次中断（崩溃或退出）的任务，再处理链接文件")
+    return parser
+
+
+def print_event(event, job, data):
+    if event == EVENT_LOG:
+        print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {data['message']}", file=sys.stderr, flush=True)
+
+
+def build_summary(jobs, wall_seconds, startup_seconds):
+    transferred = sum(j.transferred_bytes for j in jobs)
+    return {
+        "jobs": len(jobs),
+        "done": sum(1 for j in jobs if j.state == JOB_DONE),
+        "failed": sum(1 for j in jobs if j.state == JOB_FAILED),
+        "cancelled": sum(1 for j in jobs if j.state == JOB_CANCELLED),
+        "files": sum(len(j.files) for j in jobs),
+        "bytes": int(transferred),
+        "startup_seconds": round(startup_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "bytes_per_second": round(transferred / wall_seconds, 1) if wall_seconds > 0 else 0,
+        "jobs_per_minute": round(len(jobs) * 60 / wall_seconds, 2) if wall_seconds > 0 else 0,
+        "failures": [
+            {"id": j.id, "url": j.url, "error": j.error, "partial": j.state == JOB_DONE}
+            for j in jobs if j.state == JOB_FAILED or j.state == JOB_DONE and j.error
+        ],
+        "per_job": [
+            {
+                "id": j.id,
+                "parent": j.parent_id,
+                "audio_only": j.audio_only,
+                "state": j.state,
+                "bytes": int(j.transferred_bytes),
+                "bytes_per_second": round(j.transferred_bytes / (j.finished_at - j.started_at), 1)
+                if j.started_at and j.finished_at and j.finished_at > j.started_at else 0,
+                "rate_limit": j.applied_rate_limit,
+                "entries": j.outcomes.counts(),
+                "stages": {
+                    stage: {
+                        "count": entry["count"],
+                        "seconds": round(entry["seconds"], 3),
+                        "bytes": entry["bytes"],
+                        "errors": entry["errors"],
+                    }
+                    for stage, entry in j.stage_summary.items()
+                },
+            }
+            for j in jobs
+        ],
+    }
+
+
+def run_batch(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        urls = read_urls(args.batch)
+    except OSError as e:
+        print(f"无法读取链接文件: {e}", file=sys.stderr)
+        return 2
+    if not urls and not args.resume:
+        print("链接文件中没有可下载的链接", file=sys.stderr)
+        return 2
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    engine = DownloadEngine(
+        download_path=args.output,
+        is_debug=args.verbose,
+        max_jobs=args.jobs,
+        transcode_workers=args.transcode_jobs,
+    )
+    engine.add_listener(print_event)
+    if args.limit_rate is not None:
+        limit = parse_rate(args.limit_rate)
+        if not limit and args.limit_rate.strip() not in ("0", ""):
+            print(f"无法识别的限速: {args.limit_rate}", file=sys.stderr)
+            return 2
+        engine.set_bandwidth_limit(limit)
+    if engine.bandwidth_limit:
+        print(f"总限速 {format_rate_limit(engine.bandwidth_limit)}，按优先级分配给同时进行的下载", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    engine.start_warmup()
+    engine.wait_ready()
+    startup_seconds = time.perf_counter() - t0
+
+    jobs = engine.resume_jobs() if args.resume else []
+    if jobs:
+        print(f"已恢复 {len(jobs)} 个上次中断的任务", file=sys.stderr)
+    resumed_urls = {j.url for j in jobs}
+    jobs += [engine.submit(url, audio_only=args.audio_only) for url in urls if url not in resumed_urls]
+    try:
+        engine.wait()
+    except KeyboardInterrupt:
+        print("正在终止所有任务...", file=sys.stderr)
+        engine.stop_all()
+        engine.wait(timeout=15)
+    wall_seconds = time.perf_counter() - t0
+    # Without this the journal only shrinks when a run resumes from it.
+    engine.compact_journal()
+
+    # Playlists add one job per entry while they are being enumerated.
+    submitted = {j.id for j in jobs}
+    jobs += [j for j in engine.scheduler.jobs.values() if j.parent_id in submitted and j.id not in submitted]
+    summary = build_summary(jobs, wall_seconds, startup_seconds)
+    print(
+        f"完成 {summary['done']}/{summary['jobs']}，失败 {summary['failed']}，终止 {summary['cancelled']}，"
+        f"共 {summary['files']} 个文件，{summary['bytes'] / 1024 / 1024:.1f} MiB，"
+        f"用时 {summary['wall_seconds']:.1f} 秒（启动 {summary['startup_seconds']:.1f} 秒），"
+        f"平均 {summary['bytes_per_second'] / 1024 / 1024:.2f} MiB/s"
+    )
+    for failure in summary["failures"]:
+        print(f"失败 #{failure['id']} {failure['url']}: {failure['error']}")
+
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    return 0 if summary["done"] == summary["jobs"] and not summary["failures"] else 1
+
+
+def build_calibration_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py --calibrate-encoders",
+        description="测量各 CPU 编码配置的速度和输出大小，供没有硬件编码器时选择",
+    )
+    parser.add_argument("--calibrate-encoders", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--sample", metavar="FILE", default=None, help="用该视频的开头代替合成测试图案（更接近实际内容）")
+    parser.add_argument(
+        "--heights", default=",".join(str(h) for h in CALIBRATION_HEIGHTS),
+        help="测试的分辨率高度，逗号分隔（默认 %(default)s）",
+    )
+    parser.add_argument("--seconds", type=float, default=CLIP_SECONDS, help="测试片段时长（默认 %(default)s 秒）")
+    return parser
+
+
+def run_calibration(argv=None):
+    args = build_calibration_parser().parse_args(argv)
+    try:
+        heights = sorted({int(h) for h in args.heights.split(",") if h.strip()})
+    except ValueError:
+        print(f"无法识别的分辨率: {args.heights}", file=sys.stderr)
+        return 2
+    if not heights or args.seconds <= 0:
+        print("分辨率和时长必须大于 0", file=sys.stderr)
+        return 2
+    if args.sample and not os.path.exists(args.sample):
+        print(f"找不到样本文件: {args.sample}", file=sys.stderr)
+        return 2
+
+    engine = DownloadEngine()
+    engine.start_warmup()
+    engine.wait_ready()
+
+    def on_result(height, row):
+        print(
+            f"{height:>5}p  {row['profile']:<20} {row['fps']:>7.1f} fps  {row['speed']:>6.2f}x 实时  "
+            f"{row['bitrate'] * 8 / 1000:>8.0f} kbit/s",
+            flush=True,
+        )
+
+    print(f"校准 CPU 编码配置（{args.sample or '合成测试图案'}，{args.seconds:g} 秒片段）", flush=True)
+    results = engine.calibrate_encoders(args.sample, heights, args.seconds, on_result)
+    if results is None:
+        print("未找到 ffmpeg", file=sys.stderr)
+        return 2
+    if not results:
+        print("所有编码配置均未能运行", file=sys.stderr)
+        return 1
+
+    ffmpeg_exe = engine.get_ffmpeg_executable()
+    target = engine.get_encode_target()
+    print(f"选择规则（YTD_ENCODE_TARGET）：{format_target(target)}")
+    for height in sorted(results):
+        profile = engine.get_cpu_encode_profile(ffmpeg_exe, {"height": height})
+        print(f"{height:>5}p  → {profile.name}（{profile.reason}）")
+    print(f"结果已保存到 {engine.encoder_calibration.path}")
+    return 0
@@ -0,0 +1,2974 @@
+import subprocess
+import os
+import sys
+import threading
+import shutil
+import re
+import tempfile
+import json
+import heapq
+import itertools
+import time
+from datetime import datetime
+import locale
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+import collections
+
+from ytd_archive import KIND_AUDIO, KIND_VIDEO, DownloadArchive
+from ytd_calibration import (
+    CALIBRATION_HEIGHTS,
+    CLIP_FPS,
+    CLIP_SECONDS,
+    PROFILE_NAMES,
+    EncoderCalibration,
+    parse_target,
+    profile_args,
+    profile_encoder,
+)
+from ytd_formats import choose_formats
+from ytd_journal import JobJournal, new_journal_id
+from ytd_metrics import (
+    STAGE_CLEANUP,
+    STAGE_DOWNLOAD,
+    STAGE_ENCODER_PROBE,
+    STAGE_MERGE,
+    STAGE_NAMES,
+    STAGE_RESOLVE,
+    STAGE_STAGING,
+    STAGE_TRANSCODE,
+    STATUS_CANCELLED,
+    STATUS_ERROR,
+    STATUS_RESTARTED,
+    SpanRecorder,
+    summarize_spans,
+)
+from ytd_transcode_cache import TranscodeCache
+from ytd_tuning import DownloadTuner, DownloadTuning, host_key, is_download_error
+
+JOB_QUEUED = "queued"
+JOB_RESOLVING = "resolving"
+JOB_DOWNLOADING = "downloading"
+JOB_TRANSCODING = "transcoding"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+EVENT_LOG = "log"
+EVENT_JOB_STATE = "job_state"
+EVENT_RESOLVED = "resolved"
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Share of the global bandwidth budget each downloading job gets, by priority.
+PRIORITY_WEIGHTS = {PRIORITY_HIGH: 4, PRIORITY_NORMAL: 2, PRIORITY_LOW: 1}
+RATE_LIMIT_MIN = 32 * 1024
+# Changing a job's limit means restarting yt-dlp (it resumes the .part files),
+# so small or frequent changes are not worth it. Cuts keep the budget honest
+# and wait only long enough to batch jobs starting together; raises can wait.
+RATE_RESTART_THRESHOLD = 0.25
+RATE_DECREASE_MIN_INTERVAL = 2.0
+RATE_INCREASE_MIN_INTERVAL = 10.0
+# Encoders that run on the CPU; anything else came from the hardware probe.
+CPU_ENCODERS = ("libx264", "libopenh264")
+FRAGMENTED_PROTOCOLS = ("m3u8", "m3u8_native", "http_dash_segments", "dash", "ism", "f4m")
+# Resolving has no overall deadline (large channels take minutes to enumerate);
+# yt-dlp is only given up on after this long without printing anything.
+RESOLVE_STALL_TIMEOUT = 60.0
+# Prefetched entry info carries signed direct URLs that sites expire, so a job
+# that only reaches a download slot after this long resolves again.
+PREFETCH_MAX_AGE = 15 * 60
+# Info saved before a crash is reused on resume only while its URLs are
+# likely still valid; older jobs resolve again (yt-dlp still continues the
+# .part files either way).
+RESUME_INFO_MAX_AGE = 60 * 60
+
+FFMPEG_PROGRESS_KEYS = (
+    "frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+    "dup_frames", "drop_frames", "speed", "progress",
+)
+
+MP4_COPY_VIDEO_CODECS = ("h264", "hevc", "av1")
+MP4_COPY_AUDIO_CODECS = ("aac", "mp3", "opus")
+AUDIO_PASSTHROUGH_EXTS = (".mp3", ".wav", ".m4a", ".opus", ".ogg", ".aac", ".flac")
+VIDEO_FORMAT = "bv*[ext=mp4]+ba[ext=m4a]/b[ext=mp4]/bv*+ba/b"
+# Audio-only jobs never fall back to a format with video in it; -x with
+# "best" then only remuxes (opus -> .opus, aac -> .m4a, mp3 stays).
+AUDIO_FORMAT = "ba"
+# Guesses the format selection falls back on before there is anything measured:
+# download speed of a host the tuner has not seen, encode speed (multiple of
+# realtime) of an uncalibrated CPU encoder at 1080p and of a hardware encoder.
+DEFAULT_DOWNLOAD_RATE = 4 * 1024 * 1024
+DEFAULT_CPU_ENCODE_SPEED = 1.0
+HW_ENCODE_SPEED = 8.0
+
+JOB_STATE_NAMES = {
+    JOB_QUEUED: "排队中",
+    JOB_RESOLVING: "解析中",
+    JOB_DOWNLOADING: "下载中",
+    JOB_TRANSCODING: "转码中",
+    JOB_DONE: "完成",
+    JOB_FAILED: "失败",
+    JOB_CANCELLED: "已终止",
+}
+
+# Outcome of each video a yt-dlp run handles, tracked line by line.
+ENTRY_DOWNLOADING = "downloading"
+ENTRY_PROCESSING = "processing"
+ENTRY_DONE = "done"
+ENTRY_SKIPPED = "skipped"
+ENTRY_FAILED = "failed"
+ENTRY_OPEN_STATES = (ENTRY_DOWNLOADING, ENTRY_PROCESSING)
+
+# Only the end of yt-dlp's output is kept for error reports; verbose
+# playlist runs print far more than is worth holding on to.
+OUTPUT_TAIL_LINES = 200
+# "ERROR: [youtube] dQw4w9WgXcQ: Video unavailable"; errors without an id
+# belong to the entry being downloaded.
+YTDLP_ERROR_RE = re.compile(r'^ERROR:\s*(?:\[[^\]]+\]\s*([^\s:]+):\s)?(.*)$')
+# "[download] <id>: <title> has already been recorded in the archive" (no title when
+# skipped before extraction). --print implies --quiet, so only -v runs print it;
+# otherwise the entries checked against the archive before launch are marked skipped.
+YTDLP_ARCHIVED_RE = re.compile(r'^\[download\]\s+([^\s:]+):\s.*has already been recorded in the archive')
+
+ENTRY_EVENT_PREFIX = "[ytd-entry] "
+PROGRESS_EVENT_PREFIX = "[ytd-progress] "
+FILE_EVENT_PREFIX = "[ytd-file] "
+POSTPROCESS_EVENT_PREFIX = "[ytd-postprocess] "
+
+ENTRY_EVENT_TEMPLATE = (
+    'video:' + ENTRY_EVENT_PREFIX
+    + '{"id": %(id)j, "extractor": %(extractor_key)j, "title": %(title)j, "urls": %(urls)j}'
+)
+PROGRESS_EVENT_TEMPLATE = 'download:' + PROGRESS_EVENT_PREFIX + '{"id": %(info.id)j, "progress": %(progress)j}'
+# Printed once the downloads of an entry are done, before the merger and fixups run.
+POSTPROCESS_EVENT_TEMPLATE = 'post_process:' + POSTPROCESS_EVENT_PREFIX + '{"id": %(id)j}'
+FILE_EVENT_TEMPLATE = (
+    'after_move:' + FILE_EVENT_PREFIX
+    + '{"id": %(id)j, "extractor": %(extractor_key)j, "filepath": %(filepath)j, '
+    + '"format": %(format_id)j, "webpage_url": %(webpage_url)j}'
+)
+
+
+def parse_rate(text):
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:I?B)?(?:/S)?\s*$', str(text or "").upper())
+    if not m:
+        return 0
+    scale = {"": 1, "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}[m.group(2)]
+    return int(float(m.group(1)) * scale)
+
+
+def format_rate(bytes_per_sec):
+    return f"{bytes_per_sec / 1024 / 1024:.2f} MiB/s"
+
+
+def format_rate_limit(limit):
+    return format_rate(limit) if limit else "不限"
+
+
+def _event_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _event_text(value):
+    if isinstance(value, str) and value != "NA":
+        return value
+    return None
+
+
+class EntryEvent:
+    __slots__ = ("entry_id", "extractor", "title", "urls")
+
+    def __init__(self, data):
+        self.entry_id = _event_text(data.get("id"))
+        self.extractor = _event_text(data.get("extractor"))
+        self.title = _event_text(data.get("title")) or ""
+        self.urls = (_event_text(data.get("urls")) or "").split()
+
+
+class ProgressEvent:
+    __slots__ = (
+        "entry_id", "status", "filename", "downloaded_bytes", "total_bytes",
+        "speed", "eta", "fragment_index", "fragment_count",
+    )
+
+    def __init__(self, data):
+        progress = data.get("progress") if isinstance(data.get("progress"), dict) else {}
+        self.entry_id = _event_text(data.get("id"))
+        self.status = _event_text(progress.get("status")) or ""
+        self.filename = _event_text(progress.get("filename")) or ""
+        self.downloaded_bytes = _event_number(progress.get("downloaded_bytes")) or 0
+        self.total_bytes = (
+            _event_number(progress.get("total_bytes"))
+            or _event_number(progress.get("total_bytes_estimate"))
+            or 0
+        )
+        self.speed = _event_number(progress.get("speed")) or 0
+        self.eta = _event_number(progress.get("eta"))
+        self.fragment_index = _event_number(progress.get("fragment_index"))
+        self.fragment_count = _event_number(progress.get("fragment_count"))
+
+
+class FileEvent:
+    __slots__ = ("entry_id", "extractor", "filepath", "format_id", "webpage_url")
+
+    def __init__(self, data):
+        self.entry_id = _event_text(data.get("id"))
+        self.extractor = _event_text(data.get("extractor"))
+        self.filepath = _event_text(data.get("filepath")) or ""
+        self.format_id = _event_text(data.get("format"))
+        self.webpage_url = _event_text(data.get("webpage_url"))
+
+
+class PostProcessEvent:
+    __slots__ = ("entry_id",)
+
+    def __init__(self, data):
+        self.entry_id = _event_text(data.get("id"))
+
+
+YTDLP_EVENT_TYPES = (
+    (PROGRESS_EVENT_PREFIX, ProgressEvent),
+    (FILE_EVENT_PREFIX, FileEvent),
+    (ENTRY_EVENT_PREFIX, EntryEvent),
+    (POSTPROCESS_EVENT_PREFIX, PostProcessEvent),
+)
+
+
+def parse_ytdlp_event(line):
+    if not line.startswith("[ytd-"):
+        return None
+    for prefix, event_type in YTDLP_EVENT_TYPES:
+        if line.startswith(prefix):
+            try:
+                data = json.loads(line[len(prefix):])
+            except ValueError:
+                return None
+            return event_type(data) if isinstance(data, dict) else None
+    return None
+
+
+class EntryOutcomes:
+    """Per-entry results of a job's yt-dlp runs, fed one output line at a time."""
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.current = None
+        self.last_error = ""
+
+    def _entry(self, entry_id):
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            entry = self.entries[entry_id] = {"state": ENTRY_DOWNLOADING, "title": "", "error": ""}
+        return entry
+
+    def feed(self, line, event):
+        if isinstance(event, EntryEvent):
+            # Also where a restarted run picks an entry up again.
+            entry = self._entry(event.entry_id)
+            entry.update(state=ENTRY_DOWNLOADING, title=event.title or entry["title"], error="")
+            self.current = event.entry_id
+        elif isinstance(event, PostProcessEvent):
+            entry = self._entry(event.entry_id)
+            if entry["state"] == ENTRY_DOWNLOADING:
+                entry["state"] = ENTRY_PROCESSING
+        elif isinstance(event, FileEvent):
+            self._entry(event.entry_id)["state"] = ENTRY_DONE
+            if self.current == event.entry_id:
+                self.current = None
+        elif line.startswith("ERROR:"):
+            m = YTDLP_ERROR_RE.match(line)
+            entry_id, message = (m.group(1), m.group(2).strip()) if m else (None, line)
+            self.last_error = message or line
+            entry_id = entry_id or self.current
+            if entry_id is not None:
+                entry = self._entry(entry_id)
+                entry.update(state=ENTRY_FAILED, error=self.last_error)
+                if self.current == entry_id:
+                    self.current = None
+        else:
+            m = YTDLP_ARCHIVED_RE.match(line)
+            if m:
+                self.skip(m.group(1))
+
+    def skip(self, entry_id):
+        self._entry(entry_id)["state"] = ENTRY_SKIPPED
+
+    def finish(self, returncode):
+        # yt-dlp stopped without finishing these (killed, or failed without a parseable error).
+        if returncode != 0:
+            for entry in self.entries.values():
+                if entry["state"] in ENTRY_OPEN_STATES:
+                    entry.update(state=ENTRY_FAILED, error=entry["error"] or f"未完成（yt-dlp 退出码 {returncode}）")
+        self.current = None
+
+    def counts(self):
+        counts = collections.Counter(entry["state"] for entry in self.entries.values())
+        return {state: counts[state] for state in (ENTRY_DONE, ENTRY_SKIPPED, ENTRY_FAILED) if counts[state]}
+
+    def failed(self):
+        return [(entry_id, entry) for entry_id, entry in self.entries.items() if entry["state"] == ENTRY_FAILED]
+
+    def first_error(self):
+        for _, entry in self.failed():
+            return entry["error"]
+        return self.last_error
+
+
+class DownloadJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, download_path, priority=PRIORITY_NORMAL, parent_id=None, audio_only=False):
+        self.id = next(self._ids)
+        self.url = url
+        self.download_path = download_path
+        self.priority = priority
+        self.audio_only = audio_only
+        self.parent_id = parent_id
+        self.child_ids = []
+        self.child_urls = set()
+        self.entries_found = 0
+        self.prefetch = None
+        self.journal_id = None
+        self.resume_info = None
+        self.resume_transcodes_only = False
+        self.state = JOB_QUEUED
+        self.error = ""
+        self.stop_event = threading.Event()
+        self.current_process = None
+        self.transcode_processes = set()
+        self.media_info = None
+        self.resolved_url = ""
+        self.resolved_is_direct = False
+        self.total_bytes = 0
+        self.downloaded_bytes = 0
+        self.completed_bytes = 0
+        self.speed = 0
+        self.eta = None
+        self.fragment_index = None
+        self.fragment_count = None
+        self.current_file = None
+        self.manifest = collections.OrderedDict()
+        self.outcomes = EntryOutcomes()
+        self.files = []
+        self.transcode_progress = None
+        self.spans = []
+        self.rate_limit = 0
+        self.applied_rate_limit = 0
+        self.rate_applied_at = 0.0
+        self.on_state = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def is_finished(self):
+        return self.state in JOB_FINISHED_STATES
+
+    @property
+    def archive_kind(self):
+        return KIND_AUDIO if self.audio_only else KIND_VIDEO
+
+    @property
+    def is_cancelled(self):
+        return self.stop_event.is_set()
+
+    def set_state(self, state, error=""):
+        self.state = state
+        if error:
+            self.error = error
+        if state in JOB_FINISHED_STATES:
+            self.finished_at = time.time()
+            self.speed = 0
+        if self.on_state is not None:
+            self.on_state(self)
+
+    def apply_progress(self, event):
+        if event.filename != self.current_file:
+            self.completed_bytes += self.downloaded_bytes
+            self.current_file = event.filename
+        self.downloaded_bytes = event.downloaded_bytes
+        self.total_bytes = max(event.total_bytes, event.downloaded_bytes)
+        self.speed = event.speed if event.status == "downloading" else 0
+        self.eta = event.eta
+        self.fragment_index = event.fragment_index
+        self.fragment_count = event.fragment_count
+
+    def record_output(self, event):
+        if not event.filepath or event.filepath in self.manifest:
+            return None
+        record = {
+            "id": event.entry_id,
+            "extractor": event.extractor,
+            "source": event.filepath,
+            "output": None,
+            "format": event.format_id,
+            "webpage_url": event.webpage_url,
+        }
+        self.manifest[event.filepath] = record
+        return record
+
+    @property
+    def output_files(self):
+        return [r["output"] or r["source"] for r in self.manifest.values()]
+
+    @property
+    def transferred_bytes(self):
+        return self.completed_bytes + self.downloaded_bytes
+
+    @property
+    def stage_summary(self):
+        return summarize_spans(self.spans)
+
+
+class JobScheduler:
+    def __init__(self, runner, max_workers=3):
+        self.runner = runner
+        self.max_workers = max(1, max_workers)
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._released = set()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._spawn_locked()
+        return job
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+            self._spawn_locked()
+
+    def release(self, job):
+        """Give up the worker slot of a running job that is now mostly waiting, e.g. on playlist enumeration."""
+        with self._lock:
+            if job.id in self._released:
+                return
+            self._released.add(job.id)
+            self._active -= 1
+            self._spawn_locked()
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return None
+        job.stop_event.set()
+        if job.state == JOB_QUEUED:
+            job.set_state(JOB_CANCELLED)
+        return job
+
+    def _spawn_locked(self):
+        while self._active < self.max_workers and self._heap:
+            _, _, job = heapq.heappop(self._heap)
+            if job.is_cancelled:
+                continue
+            self._active += 1
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        job.started_at = time.time()
+        try:
+            self.runner(job)
+        except Exception as e:
+            job.set_state(JOB_FAILED, str(e))
+        finally:
+            if not job.is_finished:
+                job.set_state(JOB_CANCELLED if job.is_cancelled else JOB_DONE)
+            with self._lock:
+                if job.id in self._released:
+                    self._released.discard(job.id)
+                else:
+                    self._active -= 1
+                self._spawn_locked()
+
+    @property
+    def active_count(self):
+        return self._active
+
+    def is_idle(self):
+        with self._lock:
+            return self._active == 0 and not self._heap and not self._released
+
+    def throughput(self):
+        jobs = list(self.jobs.values())
+        speed = sum(j.speed for j in jobs if j.state == JOB_DOWNLOADING)
+        transferred = sum(j.transferred_bytes for j in jobs)
+        started = [j.started_at for j in jobs if j.started_at]
+        elapsed = time.time() - min(started) if started else 0
+        average = transferred / elapsed if elapsed > 0 else 0
+        return speed, average, transferred
+
+
+class TranscodeProgress:
+    def __init__(self, input_file, encoder, duration):
+        self.input_file = input_file
+        self.encoder = encoder
+        self.duration = duration or 0
+        self.out_time = 0.0
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.finished = False
+
+    def update(self, key, value):
+        try:
+            if key == "out_time_us":
+                self.out_time = max(0.0, int(value) / 1000000)
+            elif key == "frame":
+                self.frame = int(value)
+            elif key == "fps":
+                self.fps = float(value)
+            elif key == "speed":
+                self.speed = float(value.rstrip("x"))
+        except ValueError:
+            pass
+        if key == "progress":
+            self.elapsed = time.perf_counter() - self.started
+            self.finished = value == "end"
+            return True
+        return False
+
+    @property
+    def percent(self):
+        if not self.duration:
+            return None
+        return min(100.0, self.out_time * 100 / self.duration)
+
+    @property
+    def eta(self):
+        if not self.duration or not self.out_time or not self.elapsed:
+            return None
+        return max(0.0, (self.duration - self.out_time) * self.elapsed / self.out_time)
+
+    @property
+    def realtime_factor(self):
+        if self.elapsed and self.out_time:
+            return self.out_time / self.elapsed
+        return self.speed
+
+    @property
+    def average_fps(self):
+        return self.frame / self.elapsed if self.elapsed else 0.0
+
+
+class TranscodePool:
+    def __init__(self, max_workers=1):
+        self.max_workers = max(1, max_workers)
+        self._pending = collections.deque()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        future = Future()
+        with self._lock:
+            self._pending.append((future, func, args))
+            self._spawn_locked()
+        return future
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+            self._spawn_locked()
+
+    def _spawn_locked(self):
+        while self._active < self.max_workers and self._pending:
+            future, func, args = self._pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._active += 1
+            threading.Thread(target=self._run, args=(future, func, args), daemon=True).start()
+
+    def _run(self, future, func, args):
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._spawn_locked()
+
+    @property
+    def active_count(self):
+        return self._active
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+
+class MetadataPrefetcher:
+    """Bounded worker pool for per-entry resolves that also caps concurrent requests per host."""
+
+    def __init__(self, max_workers=4, per_host=2):
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self._pending = collections.deque()
+        self._active = 0
+        self._host_active = collections.Counter()
+        self._lock = threading.Lock()
+
+    def submit(self, host, func, *args):
+        future = Future()
+        with self._lock:
+            self._pending.append((host, future, func, args))
+            self._spawn_locked()
+        return future
+
+    def _spawn_locked(self):
+        skipped = collections.deque()
+        while self._active < self.max_workers and self._pending:
+            item = self._pending.popleft()
+            host, future = item[0], item[1]
+            if self._host_active[host] >= self.per_host:
+                skipped.append(item)
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._active += 1
+            self._host_active[host] += 1
+            threading.Thread(target=self._run, args=item, daemon=True).start()
+        # Entries for busy hosts keep their place ahead of anything not yet scanned.
+        self._pending.extendleft(reversed(skipped))
+
+    def _run(self, host, future, func, args):
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._host_active[host] -= 1
+                if not self._host_active[host]:
+                    del self._host_active[host]
+                self._spawn_locked()
+
+    @property
+    def active_count(self):
+        return self._active
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+
+class MediaInfo:
+    def __init__(self, source_url, data):
+        self.source_url = source_url
+        self.data = data or {}
+        self.info_path = None
+
+    @property
+    def title(self):
+        return self.data.get("title") or ""
+
+    @property
+    def is_playlist(self):
+        return self.data.get("_type") in ("playlist", "multi_video")
+
+    @property
+    def entries(self):
+        return [e for e in (self.data.get("entries") or []) if e]
+
+    def archive_keys(self):
+        if self.is_playlist:
+            items = self.entries
+        else:
+            items = [self.data]
+        return [key for key in map(self.entry_key, items) if key is not None]
+
+    @staticmethod
+    def entry_key(item):
+        extractor = item.get("extractor_key") or item.get("ie_key")
+        if extractor and item.get("id"):
+            return extractor, str(item["id"])
+        return None
+
+    @staticmethod
+    def is_playlist_entry(item):
+        return item.get("_type") in ("url", "url_transparent") or item.get("playlist_index") is not None
+
+    @staticmethod
+    def playlist_count(item):
+        """The playlist size an entry reports, or None (lazy enumeration leaves it unset or "NA")."""
+        for key in ("playlist_count", "n_entries"):
+            try:
+                count = int(item.get(key))
+            except (TypeError, ValueError):
+                continue
+            if count > 0:
+                return count
+        return None
+
+    @property
+    def formats(self):
+        return [f for f in (self.data.get("formats") or []) if f]
+
+    @staticmethod
+    def format_size(fmt):
+        return fmt.get("filesize") or fmt.get("filesize_approx") or 0
+
+    @staticmethod
+    def has_video(fmt):
+        return fmt.get("vcodec") != "none"
+
+    @staticmethod
+    def has_audio(fmt):
+        return fmt.get("acodec") != "none"
+
+    def direct_urls(self):
+        if self.is_playlist:
+            return []
+
+        formats = [f for f in self.formats if f.get("url")]
+        combined = [f for f in formats if self.has_video(f) and self.has_audio(f)]
+        combined_mp4 = [f for f in combined if f.get("ext") == "mp4"]
+        if combined_mp4:
+            return [combined_mp4[-1]["url"]]
+        if combined:
+            return [combined[-1]["url"]]
+
+        requested = [f["url"] for f in (self.data.get("requested_formats") or []) if f.get("url")]
+        if requested:
+            return requested
+        if self.data.get("url"):
+            return [self.data["url"]]
+        return []
+
+    def best_audio(self):
+        """The audio-only format ``-f ba`` would pick (roughly: highest bitrate), or None."""
+        audio = [f for f in self.formats if f.get("vcodec") == "none" and self.has_audio(f)]
+        if not audio:
+            return None
+        return max(audio, key=lambda f: (f.get("abr") or f.get("tbr") or 0, self.format_size(f)))
+
+    def is_fragmented(self):
+        if self.is_playlist:
+            return True
+        formats = self.data.get("requested_formats") or [self.data]
+        return any(
+            (f.get("protocol") or "").split("+")[0] in FRAGMENTED_PROTOCOLS or f.get("fragments")
+            for f in formats
+        )
+
+    def estimated_size(self):
+        if self.is_playlist:
+            return 0
+        requested = self.data.get("requested_formats") or []
+        if requested:
+            return sum(self.format_size(f) for f in requested)
+        return self.format_size(self.data)
+
+    def save(self, directory):
+        if self.info_path and os.path.exists(self.info_path):
+            return self.info_path
+        try:
+            fd, path = tempfile.mkstemp(prefix="ytd-info-", suffix=".info.json", dir=directory or None)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+        except Exception:
+            return None
+        self.info_path = path
+        return path
+
+    @classmethod
+    def load(cls, source_url, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return None
+        if not isinstance(data, dict):
+            return None
+        info = cls(source_url, data)
+        info.info_path = path
+        return info
+
+    def discard(self):
+        path = self.info_path
+        self.info_path = None
+        if path:
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+class EncoderCache:
+    VERSION = 1
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _empty(self):
+        return {"version": self.VERSION, "gpu_vendor": None, "ffmpeg": {}}
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        data = None
+        if self.path:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            data = self._empty()
+        self._data = data
+        return data
+
+    def _is_fresh(self, entry):
+        if not isinstance(entry, dict):
+            return False
+        age = time.time() - entry.get("created", 0)
+        return 0 <= age < self.ttl
+
+    def _save(self):
+        if not self.path:
+            return
+        data = self._data
+        data["ffmpeg"] = {k: v for k, v in data.get("ffmpeg", {}).items() if self._is_fresh(v)}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
+
+    def get_gpu_vendor(self):
+        with self._lock:
+            entry = self._load().get("gpu_vendor")
+            if self._is_fresh(entry):
+                return True, entry.get("value")
+            return False, None
+
+    def set_gpu_vendor(self, vendor):
+        with self._lock:
+            self._load()["gpu_vendor"] = {"created": time.time(), "value": vendor}
+            self._save()
+
+    def _ffmpeg_entry(self, fingerprint, create=False):
+        entries = self._load().setdefault("ffmpeg", {})
+        entry = entries.get(fingerprint)
+        if not self._is_fresh(entry):
+            entry = None
+            entries.pop(fingerprint, None)
+        if entry is None and create:
+            entry = {"created": time.time(), "encoders": None, "probes": {}}
+            entries[fingerprint] = entry
+        return entry
+
+    def get_encoders(self, fingerprint):
+        if not fingerprint:
+            return None
+        with self._lock:
+            entry = self._ffmpeg_entry(fingerprint)
+            if entry is None or entry.get("encoders") is None:
+                return None
+            return set(entry["encoders"])
+
+    def set_encoders(self, fingerprint, encoders):
+        if not fingerprint:
+            return
+        with self._lock:
+            self._ffmpeg_entry(fingerprint, create=True)["encoders"] = sorted(encoders)
+            self._save()
+
+    def get_probe(self, fingerprint, encoder_name):
+        if not fingerprint:
+            return None
+        with self._lock:
+            entry = self._ffmpeg_entry(fingerprint)
+            if entry is None:
+                return None
+            cached = entry.get("probes", {}).get(encoder_name)
+            if not isinstance(cached, list) or len(cached) != 2:
+                return None
+            return (bool(cached[0]), cached[1])
+
+    def set_probe(self, fingerprint, encoder_name, result):
+        if not fingerprint:
+            return
+        with self._lock:
+            entry = self._ffmpeg_entry(fingerprint, create=True)
+            entry.setdefault("probes", {})[encoder_name] = [bool(result[0]), result[1]]
+            self._save()
+
+
+class DownloadEngine:
+    def __init__(self, download_path=None, is_debug=False, max_jobs=None, transcode_workers=None):
+        self.download_path = download_path or self.get_default_download_path()
+        self.is_debug = is_debug
+        self.listeners = []
+        self.scheduler = JobScheduler(self.run_job, max_workers=max_jobs or self.get_default_max_jobs())
+        self.transcode_pool = TranscodePool(max_workers=transcode_workers or self.get_default_transcode_workers())
+        self.active_outputs = set()
+        self.active_outputs_lock = threading.Lock()
+        self.bandwidth_limit = self.get_default_bandwidth_limit()
+        self.bandwidth_lock = threading.Lock()
+        self.transcode_stats_lock = threading.Lock()
+        self._ffmpeg_encoder_cache = {}
+        self._ffmpeg_encoder_probe_cache = {}
+        self._gpu_vendor_cache = None
+        self._ffmpeg_encoder_list_cache = {}
+
+        self.tools_dir = self.get_tools_dir()
+        self.encoder_cache = EncoderCache(self.get_encoder_cache_path(), self.get_encoder_cache_ttl())
+        self.encoder_calibration = EncoderCalibration(self.get_encoder_calibration_path())
+        self.archive = DownloadArchive(self.get_archive_path())
+        self.transcode_cache = TranscodeCache(self.get_transcode_cache_dir(), self.get_transcode_cache_max_bytes())
+        self.tuner = DownloadTuner(self.get_tuning_path()) if self.is_tuning_enabled() else None
+        self.metrics = SpanRecorder(*self.get_metrics_paths())
+        self.journal = JobJournal(self.get_journal_dir())
+        prefetch_workers = self.get_prefetch_workers()
+        self.prefetcher = (
+            MetadataPrefetcher(prefetch_workers, self.get_prefetch_per_host()) if prefetch_workers else None
+        )
+
+        self.yt_dlp_path = None
+        self.ffmpeg_path = None
+        self.warmup_pool = None
+        self.tool_futures = {}
+        self.warmup_futures = {}
+        self.warmup_timings = {}
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, job=None, **data):
+        for listener in list(self.listeners):
+            try:
+                listener(event, job, data)
+            except Exception:
+                pass
+
+    def log(self, message, job=None):
+        self.emit(EVENT_LOG, job, message=message)
+
+    def job_log(self, job, message):
+        self.log(f"[#{job.id}] {message}", job)
+
+    def get_subprocess_encoding(self):
+        forced = os.environ.get("YTD_OUTPUT_ENCODING", "").strip()
+        if forced:
+            return forced
+        if os.name == "nt":
+            try:
+                enc = locale.getpreferredencoding(False)
+            except Exception:
+                enc = "mbcs"
+            return enc or "mbcs"
+        return "utf-8"
+
+    def _set_resolved_url(self, job, url, is_direct=False):
+        job.resolved_url = url
+        job.resolved_is_direct = is_direct
+        self.emit(EVENT_RESOLVED, job, url=url, is_direct=is_direct)
+
+    def get_creationflags(self):
+        if os.name == "nt" and hasattr(subprocess, "CREATE_NO_WINDOW"):
+            return subprocess.CREATE_NO_WINDOW
+        return 0
+
+    def get_startupinfo(self):
+        if self.is_debug or os.name != "nt":
+            return None
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+        return startupinfo
+
+    def is_hwaccel_enabled(self):
+        v = os.environ.get("YTD_HWACCEL", "1").strip().lower()
+        return v not in ("0", "false", "off", "no")
+
+    def get_tools_dir(self):
+        base = os.path.join(tempfile.gettempdir(), "ytd-tools")
+        try:
+            os.makedirs(base, exist_ok=True)
+        except Exception:
+            return None
+        return base
+
+    def get_data_dir(self):
+        if os.name == "nt":
+            base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        else:
+            base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+        path = os.path.join(base, "ytd")
+        try:
+            os.makedirs(path, exist_ok=True)
+        except Exception:
+            return None
+        return path
+
+    def get_archive_path(self):
+        v = os.environ.get("YTD_ARCHIVE", "1").strip().lower()
+        if v in ("0", "false", "off", "no"):
+            return None
+        forced = os.environ.get("YTD_ARCHIVE_PATH", "").strip()
+        if forced:
+            return forced
+        data_dir = self.get_data_dir()
+        if not data_dir:
+            return None
+        return os.path.join(data_dir, "archive.sqlite3")
+
+    def get_transcode_cache_dir(self):
+        data_dir = self.get_data_dir()
+        if not data_dir:
+            return None
+        return os.path.join(data_dir, "transcode-cache")
+
+    def get_transcode_cache_max_bytes(self):
+        try:
+            mb = float(os.environ.get("YTD_TRANSCODE_CACHE_MB", "4096"))
+        except ValueError:
+            mb = 4096
+        return int(max(0.0, mb) * 1024 * 1024)
+
+    def is_tuning_enabled(self):
+        v = os.environ.get("YTD_TUNE", "1").strip().lower()
+        return v not in ("0", "false", "off", "no")
+
+    def get_tuning_path(self):
+        data_dir = self.get_data_dir()
+        if not data_dir:
+            return None
+        return os.path.join(data_dir, "download-tuning.json")
+
+    def get_download_tuning(self, url, fragmented=True):
+        host = host_key(url)
+        if self.tuner is None:
+            return DownloadTuning(host, 10, "16K", reason="固定值（YTD_TUNE=0）", fragmented=fragmented)
+        return self.tuner.choose(host, fragmented)
+
+    def is_format_select_enabled(self):
+        v = os.environ.get("YTD_FORMAT_SELECT", "1").strip().lower()
+        return v not in ("0", "false", "off", "no")
+
+    def get_format_caps(self):
+        """(max height, max kbps) from YTD_MAX_HEIGHT / YTD_MAX_KBPS; 0 means no cap."""
+        caps = []
+        for name in ("YTD_MAX_HEIGHT", "YTD_MAX_KBPS"):
+            try:
+                caps.append(max(0, int(float(os.environ.get(name, "0")))))
+            except ValueError:
+                caps.append(0)
+        return tuple(caps)
+
+    def _expected_download_rate(self, tuning):
+        rate = self.tuner.expected_speed(tuning.host, tuning.fragmented) if self.tuner is not None else None
+        rate = rate or DEFAULT_DOWNLOAD_RATE
+        if self.bandwidth_limit:
+            rate = min(rate, self.bandwidth_limit)
+        return rate
+
+    def _expected_encode_speed(self, ffmpeg_exe):
+        """Height -> expected encode speed (multiple of realtime) of the encoder a transcode would use."""
+        encoder, _, _ = self._pick_video_encoder(ffmpeg_exe)
+        if encoder not in CPU_ENCODERS:
+            return lambda height: HW_ENCODE_SPEED
+
+        def speed(height):
+            profile = self.get_cpu_encode_profile(ffmpeg_exe, {"height": height})
+            if profile.speed:
+                return profile.speed
+            # Uncalibrated: encode time grows roughly with the pixel count.
+            return DEFAULT_CPU_ENCODE_SPEED * (1080 / max(height or 1080, 144)) ** 2
+
+        return speed
+
+    def _select_formats(self, job, ffmpeg_exe, tuning):
+        """The -f value for a video job: the explicit format ids that reach an mp4 soonest, falling back to VIDEO_FORMAT."""
+        info = job.media_info
+        if info is None or info.is_playlist or not info.formats or not ffmpeg_exe:
+            return VIDEO_FORMAT
+        if not self.is_format_select_enabled():
+            return VIDEO_FORMAT
+        max_height, max_kbps = self.get_format_caps()
+        choice = choose_formats(
+            info.formats,
+            info.data.get("duration"),
+            self._expected_download_rate(tuning),
+            self._expected_encode_speed(ffmpeg_exe),
+            MP4_COPY_VIDEO_CODECS,
+            MP4_COPY_AUDIO_CODECS,
+            max_height,
+            max_kbps,
+        )
+        if choice is None:
+            return VIDEO_FORMAT
+        self.job_log(job, f"格式选择：{choice.describe()}，{choice.reason}")
+        # Signed URLs can expire between resolving and downloading; let yt-dlp pick then.
+        return f"{choice.spec}/{VIDEO_FORMAT}"
+
+    def get_metrics_paths(self):
+        """(JSONL path, Prometheus text file path) for stage spans, per YTD_METRICS."""
+        v = os.environ.get("YTD_METRICS", "jsonl").strip().lower()
+        if v in ("0", "false", "off", "no"):
+            return None, None
+        forced = os.environ.get("YTD_METRICS_DIR", "").strip()
+        directory = forced or self.get_data_dir()
+        if not directory:
+            return None, None
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except Exception:
+            return None, None
+        jsonl = os.path.join(directory, "spans.jsonl") if v in ("jsonl", "both") else None
+        prom = os.path.join(directory, "metrics.prom") if v in ("prometheus", "prom", "both") else None
+        return jsonl, prom
+
+    def get_journal_dir(self):
+        v = os.environ.get("YTD_JOURNAL", "1").strip().lower()
+        if v in ("0", "false", "off", "no"):
+            return None
+        data_dir = self.get_data_dir()
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, "jobs")
+        try:
+            os.makedirs(path, exist_ok=True)
+        except Exception:
+            return None
+        return path
+
+    def get_info_dir(self):
+        # With the journal on, saved info lives next to it so a resumed job can reuse it.
+        return self.journal.directory if self.journal.enabled else self.tools_dir
+
+    def get_encoder_cache_path(self):
+        if not self.tools_dir:
+            return None
+        return os.path.join(self.tools_dir, "encoder-cache.json")
+
+    def get_encoder_calibration_path(self):
+        if not self.tools_dir:
+            return None
+        return os.path.join(self.tools_dir, "encoder-calibration.json")
+
+    def get_encode_target(self):
+        return parse_target(os.environ.get("YTD_ENCODE_TARGET", ""))
+
+    def get_encoder_cache_ttl(self):
+        try:
+            hours = float(os.environ.get("YTD_ENCODER_CACHE_TTL_HOURS", "168"))
+        except ValueError:
+            hours = 168
+        return max(0.0, hours) * 3600
+
+    def get_tool_fingerprint(self, path, file_name=None):
+        try:
+            size = os.path.getsize(path)
+            mtime = int(os.path.getmtime(path))
+        except Exception:
+            return None
+        return f"{file_name or os.path.basename(path)}-{size}-{mtime}"
+
+    def get_resource_path(self, relative_path):
+        if hasattr(sys, "_MEIPASS"):
+            base_path = sys._MEIPASS
+        elif getattr(sys, "frozen", False):
+            base_path = os.path.dirname(sys.executable)
+        else:
+            base_path = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(base_path, relative_path)
+
+    def resolve_ytdlp_path(self):
+        bundled = self.get_resource_path("yt-dlp.exe")
+        if os.path.exists(bundled):
+            return self.ensure_tool_in_temp(bundled, "yt-dlp.exe")
+        found = shutil.which("yt-dlp")
+        if found:
+            return found
+        return bundled
+
+    def resolve_ffmpeg_path(self):
+        bundled = self.get_resource_path("ffmpeg.exe")
+        if os.path.exists(bundled):
+            return self.ensure_tool_in_temp(bundled, "ffmpeg.exe")
+        found = shutil.which("ffmpeg")
+        if found:
+            return found
+        return bundled
+
+    def ensure_tool_in_temp(self, source_path, file_name):
+        if not self.tools_dir:
+            return source_path
+
+        fingerprint = self.get_tool_fingerprint(source_path, file_name)
+        if not fingerprint:
+            return source_path
+
+        fingerprint_dir = os.path.join(self.tools_dir, fingerprint)
+        try:
+            os.makedirs(fingerprint_dir, exist_ok=True)
+        except Exception:
+            return source_path
+
+        target_path = os.path.join(fingerprint_dir, file_name)
+        if os.path.exists(target_path):
+            return target_path
+
+        tmp_path = target_path + ".tmp"
+        try:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except Exception:
+                    pass
+            shutil.copy2(source_path, tmp_path)
+            os.replace(tmp_path, target_path)
+            return target_path
+        except Exception:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
+            return source_path
+
+    def get_ffmpeg_executable(self):
+        if self.ffmpeg_path and os.path.exists(self.ffmpeg_path):
+            return self.ffmpeg_path
+        found = shutil.which("ffmpeg")
+        if found:
+            self.ffmpeg_path = found
+            return found
+        return None
+
+    def _get_gpu_vendor(self):
+        if self._gpu_vendor_cache is not None:
+            return self._gpu_vendor_cache
+
+        found, vendor = self.encoder_cache.get_gpu_vendor()
+        if found:
+            self._gpu_vendor_cache = vendor
+            return vendor
+
+        vendor = None
+        detected = os.name != "nt"
+        if os.name == "nt":
+            try:
+                cmd = [
+                    "powershell",
+                    "-NoProfile",
+                    "-Command",
+                    "Get-CimInstance Win32_VideoController | Select-Object -ExpandProperty Name",
+                ]
+                with self.metrics.span(STAGE_ENCODER_PROBE, detail="gpu") as span:
+                    r = subprocess.run(
+                        cmd,
+                        capture_output=True,
+                        text=True,
+                        encoding="utf-8",
+                        errors="replace",
+                        timeout=5,
+                        creationflags=self.get_creationflags(),
+                    )
+                    span.set_exit(r.returncode)
+                names = (r.stdout or "").upper()
+                if "NVIDIA" in names:
+                    vendor = "nvidia"
+                elif "AMD" in names or "RADEON" in names:
+                    vendor = "amd"
+                elif "INTEL" in names:
+                    vendor = "intel"
+                detected = r.returncode == 0
+            except Exception:
+                vendor = None
+
+        if detected:
+            self.encoder_cache.set_gpu_vendor(vendor)
+        self._gpu_vendor_cache = vendor
+        return vendor
+
+    def _list_ffmpeg_encoders(self, ffmpeg_exe):
+        cached = self._ffmpeg_encoder_list_cache.get(ffmpeg_exe)
+        if cached is not None:
+            return cached
+
+        fingerprint = self.get_tool_fingerprint(ffmpeg_exe)
+        encoders = self.encoder_cache.get_encoders(fingerprint)
+        if encoders is not None:
+            self._ffmpeg_encoder_list_cache[ffmpeg_exe] = encoders
+            return encoders
+
+        try:
+            with self.metrics.span(STAGE_ENCODER_PROBE, detail="-encoders") as span:
+                r = subprocess.run(
+                    [ffmpeg_exe, "-hide_banner", "-encoders"],
+                    capture_output=True,
+                    text=True,
+                    encoding=self.get_subprocess_encoding(),
+                    errors="replace",
+                    timeout=8,
+                    stdin=subprocess.DEVNULL,
+                    creationflags=self.get_creationflags(),
+                )
+                span.set_exit(r.returncode)
+        except Exception:
+            return set()
+
+        encoders = set()
+        in_table = False
+        for line in ((r.stdout or "") + "\n" + (r.stderr or "")).splitlines():
+            parts = line.split()
+            if not in_table:
+                in_table = bool(parts) and set(parts[0]) == {"-"}
+                continue
+            if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in "VAS":
+                encoders.add(parts[1])
+
+        if r.returncode == 0 and encoders:
+            self.encoder_cache.set_encoders(fingerprint, encoders)
+        self._ffmpeg_encoder_list_cache[ffmpeg_exe] = encoders
+        return encoders
+
+    def _ffmpeg_supports_encoder(self, ffmpeg_exe, encoder_name):
+        key = (ffmpeg_exe, encoder_name)
+        cached = self._ffmpeg_encoder_cache.get(key)
+        if cached is not None:
+            return cached
+
+        supported = encoder_name in self._list_ffmpeg_encoders(ffmpeg_exe)
+        self._ffmpeg_encoder_cache[key] = supported
+        return supported
+
+    def _probe_ffmpeg_encoder(self, ffmpeg_exe, encoder_name):
+        key = (ffmpeg_exe, encoder_name)
+        cached = self._ffmpeg_encoder_probe_cache.get(key)
+        if cached is not None:
+            return cached
+
+        fingerprint = self.get_tool_fingerprint(ffmpeg_exe)
+        cached = self.encoder_cache.get_probe(fingerprint, encoder_name)
+        if cached is not None:
+            self._ffmpeg_encoder_probe_cache[key] = cached
+            return cached
+
+        if not self._ffmpeg_supports_encoder(ffmpeg_exe, encoder_name):
+            self._ffmpeg_encoder_probe_cache[key] = (False, "not present")
+            return self._ffmpeg_encoder_probe_cache[key]
+
+        sink = "NUL" if os.name == "nt" else "/dev/null"
+        cmd = [
+            ffmpeg_exe,
+            "-hide_banner",
+            "-nostdin",
+            "-f",
+            "lavfi",
+            "-i",
+            "color=c=black:s=128x128:r=30:d=0.2",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:v",
+            encoder_name,
+            "-t",
+            "0.2",
+            "-f",
+            "null",
+            sink,
+        ]
+
+        try:
+            with self.metrics.span(STAGE_ENCODER_PROBE, detail=encoder_name) as span:
+                r = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    encoding=self.get_subprocess_encoding(),
+                    errors="replace",
+                    timeout=8,
+                    stdin=subprocess.DEVNULL,
+                    creationflags=self.get_creationflags(),
+                )
+                span.set_exit(r.returncode)
+            out = ((r.stdout or "") + "\n" + (r.stderr or "")).strip()
+            if r.returncode == 0:
+                result = (True, "")
+            else:
+                hint = out.splitlines()[-1] if out else f"exit {r.returncode}"
+                result = (False, hint)
+            self.encoder_cache.set_probe(fingerprint, encoder_name, result)
+        except Exception as e:
+            result = (False, str(e))
+
+        self._ffmpeg_encoder_probe_cache[key] = result
+        return result
+
+    def _pick_video_encoder(self, ffmpeg_exe):
+        if not ffmpeg_exe or not os.path.exists(ffmpeg_exe):
+            return ("libx264", [], "")
+
+        if not self.is_hwaccel_enabled():
+            return ("libx264", [], "")
+
+        vendor = self._get_gpu_vendor()
+        candidates = []
+
+        if vendor == "nvidia":
+            candidates = ["h264_nvenc", "h264_qsv", "h264_amf"]
+        elif vendor == "intel":
+            candidates = ["h264_qsv", "h264_nvenc", "h264_amf"]
+        elif vendor == "amd":
+            candidates = ["h264_amf", "h264_nvenc", "h264_qsv"]
+        else:
+            candidates = ["h264_nvenc", "h264_qsv", "h264_amf"]
+
+        last_error = ""
+        for enc in candidates:
+            usable, hint = self._probe_ffmpeg_encoder(ffmpeg_exe, enc)
+            if usable:
+                return (enc, [], "")
+            if hint:
+                last_error = f"{enc}: {hint}"
+
+        return ("libx264", [], last_error)
+
+    def _calibration_key(self, ffmpeg_exe):
+        fingerprint = self.get_tool_fingerprint(ffmpeg_exe)
+        return f"{fingerprint}-cpu{os.cpu_count() or 1}" if fingerprint else None
+
+    def get_cpu_encode_profile(self, ffmpeg_exe, probe=None):
+        height = probe.get("height") if probe else None
+        key = self._calibration_key(ffmpeg_exe) if ffmpeg_exe else None
+        return self.encoder_calibration.choose(key, height, self.get_encode_target())
+
+    def _run_calibration_cmd(self, cmd):
+        try:
+            r = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                encoding=self.get_subprocess_encoding(),
+                errors="replace",
+                timeout=600,
+                stdin=subprocess.DEVNULL,
+                creationflags=self.get_creationflags(),
+            )
+        except Exception:
+            return -1
+        return r.returncode
+
+    def calibrate_encoders(self, sample=None, heights=CALIBRATION_HEIGHTS, seconds=CLIP_SECONDS, on_result=None):
+        """Encode a short clip at each height with every CPU profile and store speed and size.
+
+        The clip is ``sample`` (its first ``seconds``, scaled) or a synthetic
+        test pattern. Returns {height: [result, ...]}, or None without ffmpeg.
+        """
+        ffmpeg_exe = self.get_ffmpeg_executable()
+        if not ffmpeg_exe:
+            return None
+        available = self._list_ffmpeg_encoders(ffmpeg_exe)
+        profiles = [name for name in PROFILE_NAMES if profile_encoder(name) in available]
+        work_dir = tempfile.mkdtemp(prefix="ytd-calibrate-", dir=self.tools_dir or None)
+        results = {}
+        try:
+            for height in heights:
+                clip = os.path.join(work_dir, f"clip{height}.mkv")
+                if not self._render_calibration_clip(ffmpeg_exe, clip, height, sample, seconds):
+                    continue
+                rows = []
+                for name in profiles:
+                    row = self._calibrate_profile(ffmpeg_exe, clip, name, height, work_dir)
+                    if row is None:
+                        continue
+                    rows.append(row)
+                    if on_result is not None:
+                        on_result(height, row)
+                if rows:
+                    results[height] = rows
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if results:
+            clip_name = os.path.basename(sample) if sample else "testsrc2"
+            self.encoder_calibration.store(self._calibration_key(ffmpeg_exe), clip_name, results)
+        return results
+
+    def _render_calibration_clip(self, ffmpeg_exe, path, height, sample, seconds):
+        # Rendered once per height to lossless FFV1 so every profile reads the
+        # same frames and the timings measure the encoder, not the source.
+        if sample:
+            source = ["-t", f"{seconds:g}", "-i", sample, "-vf", f"scale=-2:{height}"]
+        else:
+            width = (height * 16 // 9 + 1) // 2 * 2
+            pattern = f"testsrc2=s={width}x{height}:r={CLIP_FPS}:d={seconds:g},noise=alls=6:allf=t"
+            source = ["-f", "lavfi", "-i", pattern]
+        cmd = [ffmpeg_exe, "-hide_banner", "-nostdin", "-v", "error"] + source + [
+            "-an", "-r", str(CLIP_FPS), "-c:v", "ffv1", "-pix_fmt", "yuv420p", "-y", path,
+        ]
+        return self._run_calibration_cmd(cmd) == 0 and os.path.exists(path)
+
+    def _calibrate_profile(self, ffmpeg_exe, clip, name, height, work_dir):
+        output = os.path.join(work_dir, f"{name}-{height}.mp4")
+        cmd = [ffmpeg_exe, "-hide_banner", "-nostdin", "-v", "error", "-i", clip, "-an"] + profile_args(name, height) + [
+            "-threads", "0", "-y", output,
+        ]
+        with self.metrics.span(STAGE_ENCODER_PROBE, detail=f"calibrate {name}@{height}p") as span:
+            started = time.perf_counter()
+            returncode = self._run_calibration_cmd(cmd)
+            elapsed = time.perf_counter() - started
+            span.set_exit(returncode)
+            span.bytes = self._file_size(output)
+        if returncode != 0 or not span.bytes or elapsed <= 0:
+            return None
+        probe = self._probe_media(ffmpeg_exe, output)
+        duration = probe and probe["duration"]
+        if not duration:
+            return None
+        return {
+            "profile": name,
+            "speed": round(duration / elapsed, 3),
+            "fps": round(duration * CLIP_FPS / elapsed, 1),
+            "bitrate": int(span.bytes / duration),
+        }
+
+    def get_ffprobe_executable(self, ffmpeg_exe):
+        if ffmpeg_exe:
+            name = "ffprobe.exe" if ffmpeg_exe.lower().endswith(".exe") else "ffprobe"
+            sibling = os.path.join(os.path.dirname(ffmpeg_exe), name)
+            if os.path.exists(sibling):
+                return sibling
+        return shutil.which("ffprobe")
+
+    def _probe_media(self, ffmpeg_exe, input_file):
+        probe = {"video": [], "audio": [], "duration": None, "stream_durations": {}, "height": None}
+        ffprobe_exe = self.get_ffprobe_executable(ffmpeg_exe)
+        try:
+            if ffprobe_exe:
+                r = subprocess.run(
+                    [
+                        ffprobe_exe,
+                        "-v", "error",
+                        "-show_entries", "stream=codec_type,codec_name,duration,height:format=duration",
+                        "-of", "json",
+                        input_file,
+                    ],
+                    capture_output=True,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    timeout=15,
+                    stdin=subprocess.DEVNULL,
+                    creationflags=self.get_creationflags(),
+                )
+                data = json.loads(r.stdout or "{}")
+                for stream in data.get("streams") or []:
+                    kind = stream.get("codec_type")
+                    if kind in ("video", "audio"):
+                        probe[kind].append((stream.get("codec_name") or "").lower())
+                        if kind == "video" and probe["height"] is None and stream.get("height"):
+                            probe["height"] = stream.get("height")
+                        try:
+                            probe["stream_durations"].setdefault(kind, float(stream.get("duration")))
+                        except (TypeError, ValueError):
+                            pass
+                try:
+                    probe["duration"] = float((data.get("format") or {}).get("duration"))
+                except (TypeError, ValueError):
+                    pass
+                return probe
+
+            r = subprocess.run(
+                [ffmpeg_exe, "-hide_banner", "-nostdin", "-i", input_file],
+                capture_output=True,
+                text=True,
+                encoding=self.get_subprocess_encoding(),
+                errors="replace",
+                timeout=15,
+                stdin=subprocess.DEVNULL,
+                creationflags=self.get_creationflags(),
+            )
+        except Exception:
+            return None
+
+        stream_re = re.compile(r'^\s*Stream #\d+:\d+.*?: (Video|Audio): (\w+)')
+        size_re = re.compile(r', (\d{2,5})x(\d{2,5})[, \[]')
+        duration_re = re.compile(r'^\s*Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+        for line in (r.stderr or "").splitlines():
+            m = stream_re.match(line)
+            if m:
+                probe[m.group(1).lower()].append(m.group(2).lower())
+                size = size_re.search(line)
+                if m.group(1) == "Video" and size and probe["height"] is None:
+                    probe["height"] = int(size.group(2))
+                continue
+            m = duration_re.match(line)
+            if m:
+                probe["duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+        return probe
+
+    def _plan_stream_copy(self, probe):
+        if not probe or not probe["video"] and not probe["audio"]:
+            return False, False
+        copy_video = all(c in MP4_COPY_VIDEO_CODECS for c in probe["video"])
+        copy_audio = all(c in MP4_COPY_AUDIO_CODECS for c in probe["audio"])
+        return copy_video, copy_audio
+
+    def _build_transcode_cmd(self, ffmpeg_exe, input_file, output_file, prefer_hw=True, probe=None, cpu_profile=None):
+        base = [
+            ffmpeg_exe,
+            "-hide_banner",
+            "-nostdin",
+            "-progress",
+            "pipe:1",
+            "-nostats",
+            "-i",
+            input_file,
+        ]
+
+        copy_video, copy_audio = self._plan_stream_copy(probe)
+        note = ""
+        if copy_video:
+            encoder = "copy"
+            video_args = ["-c:v", "copy"]
+            if "hevc" in probe["video"]:
+                video_args += ["-tag:v", "hvc1"]
+        else:
+            if prefer_hw:
+                encoder, extra, note = self._pick_video_encoder(ffmpeg_exe)
+            else:
+                encoder, extra = ("libx264", [])
+
+            if encoder == "libx264":
+                profile = cpu_profile or self.get_cpu_encode_profile(ffmpeg_exe, probe)
+                encoder = profile.encoder
+                video_args = list(profile.args)
+            else:
+                video_args = ["-c:v", encoder] + extra
+
+        audio_args = self._build_audio_args(probe, copy_audio)
+        container_args = ["-movflags", "+faststart", "-threads", "0", "-y", output_file]
+        return base + video_args + audio_args + container_args, encoder, note
+
+    def _build_audio_args(self, probe, copy_audio):
+        if copy_audio:
+            audio_args = ["-c:a", "copy"]
+            if "opus" in probe["audio"]:
+                audio_args += ["-strict", "experimental"]
+            return audio_args
+        return ["-c:a", "aac", "-b:a", "192k"]
+
+    def _run_ffmpeg(self, job, cmd, progress=None, on_update=None):
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding=self.get_subprocess_encoding(),
+            errors="replace",
+            stdin=subprocess.DEVNULL,
+            creationflags=self.get_creationflags(),
+            startupinfo=self.get_startupinfo(),
+        )
+        job.transcode_processes.add(proc)
+        try:
+            for line in proc.stdout:
+                if job.is_cancelled:
+                    break
+                key, sep, value = line.strip().partition("=")
+                if sep and key in FFMPEG_PROGRESS_KEYS:
+                    if progress is not None:
+                        progress.update(key, value.strip())
+                        if on_update is not None:
+                            on_update()
+                    continue
+                if self.is_debug and line.strip():
+                    self.job_log(job, line.strip())
+            if job.is_cancelled:
+                self._kill_tree(proc)
+            proc.wait()
+        finally:
+            job.transcode_processes.discard(proc)
+        return proc.returncode
+
+    def _transcode_segmented(self, job, ffmpeg_exe, input_file, output_file, probe, copy_audio, segments, profile):
+        """Encode the video in keyframe-aligned segments in parallel, then concat and mux the audio once.
+
+        Returns the aggregated TranscodeProgress on success, None on failure or cancel.
+        """
+        duration = probe["duration"]
+        work_dir = tempfile.mkdtemp(prefix="ytd-seg-", dir=self.tools_dir or None)
+        try:
+            split_cmd = [
+                ffmpeg_exe, "-hide_banner", "-nostdin", "-v", "error",
+                "-i", input_file,
+                "-map", "0:v:0", "-c", "copy",
+                "-f", "segment", "-segment_time", f"{duration / segments:.3f}", "-reset_timestamps", "1",
+                os.path.join(work_dir, "src%03d.mkv"),
+            ]
+            if self._run_ffmpeg(job, split_cmd) != 0:
+                return None
+            sources = sorted(n for n in os.listdir(work_dir) if n.startswith("src"))
+            if not sources:
+                return None
+
+            self.job_log(job, f"分段转码：{len(sources)} 段并行编码（{profile.name}）")
+            threads = max(1, (os.cpu_count() or 1) // len(sources))
+            progress = TranscodeProgress(input_file, f"{profile.name}x{len(sources)}", duration)
+            job.transcode_progress = progress
+            parts = [TranscodeProgress(name, profile.name, None) for name in sources]
+
+            def aggregate():
+                progress.out_time = sum(p.out_time for p in parts)
+                progress.frame = sum(p.frame for p in parts)
+                progress.fps = sum(p.fps for p in parts)
+                progress.speed = sum(p.speed for p in parts)
+                progress.elapsed = time.perf_counter() - progress.started
+
+            def encode(index):
+                cmd = [
+                    ffmpeg_exe, "-hide_banner", "-nostdin", "-progress", "pipe:1", "-nostats",
+                    "-i", os.path.join(work_dir, sources[index]),
+                    "-an",
+                ] + profile.args + [
+                    "-threads", str(threads), "-y", os.path.join(work_dir, f"enc{index:03d}.mp4"),
+                ]
+                return self._run_ffmpeg(job, cmd, parts[index], aggregate)
+
+            with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="ytd-segment") as pool:
+                results = list(pool.map(encode, range(len(sources))))
+            if any(rc != 0 for rc in results) or job.is_cancelled:
+                return None
+
+            list_path = os.path.join(work_dir, "concat.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                for index in range(len(sources)):
+                    f.write(f"file 'enc{index:03d}.mp4'\n")
+
+            mux_cmd = [
+                ffmpeg_exe, "-hide_banner", "-nostdin", "-v", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", input_file,
+                "-map", "0:v:0", "-map", "1:a:0?",
+                "-c:v", "copy",
+            ] + self._build_audio_args(probe, copy_audio) + ["-movflags", "+faststart", "-y", output_file]
+            if self._run_ffmpeg(job, mux_cmd) != 0 or job.is_cancelled:
+                return None
+            aggregate()
+            progress.out_time = duration
+            progress.finished = True
+
+            ok, message = self._verify_transcode(ffmpeg_exe, output_file, probe)
+            if not ok:
+                self.job_log(job, f"分段转码校验失败：{message}")
+                try:
+                    os.remove(output_file)
+                except Exception:
+                    pass
+                return None
+            self.job_log(job, f"分段转码校验通过：{message}")
+            return progress
+        except Exception as e:
+            self.job_log(job, f"分段转码出错: {str(e)}")
+            return None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _verify_transcode(self, ffmpeg_exe, output_file, probe):
+        result = self._probe_media(ffmpeg_exe, output_file)
+        if result is None or not result["duration"]:
+            return False, "无法读取输出时长"
+        expected = probe["duration"]
+        tolerance = max(0.5, expected * 0.005)
+        drift = abs(result["duration"] - expected)
+        if drift > tolerance:
+            return False, f"时长 {result['duration']:.2f}s，源文件 {expected:.2f}s"
+        message = f"时长误差 {drift:.2f}s"
+
+        src = probe.get("stream_durations") or {}
+        out = result.get("stream_durations") or {}
+        if "video" in out and "audio" in out:
+            src_gap = src["video"] - src["audio"] if "video" in src and "audio" in src else 0.0
+            sync = abs((out["video"] - out["audio"]) - src_gap)
+            if sync > 0.2:
+                return False, f"音画偏差 {sync:.2f}s"
+            message += f"，音画偏差 {sync:.3f}s"
+        return True, message
+
+    def _timed_warmup(self, name, func):
+        def run():
+            t0 = time.perf_counter()
+            try:
+                return func()
+            finally:
+                self.warmup_timings[name] = (time.perf_counter() - t0) * 1000
+        return run
+
+    def start_warmup(self):
+        self.warmup_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="ytd-warmup")
+        submit = lambda name, func: self.warmup_pool.submit(self._timed_warmup(name, func))
+
+        # Staging tasks are submitted first so the dependent tasks below never
+        # block on a future that has not started yet.
+        self.tool_futures = {
+            "yt-dlp 暂存": submit("yt-dlp 暂存", self._warm_ytdlp),
+            "ffmpeg 暂存": submit("ffmpeg 暂存", self._warm_ffmpeg),
+        }
+        self.warmup_futures = dict(self.tool_futures)
+        self.warmup_futures["yt-dlp 版本"] = submit("yt-dlp 版本", self._check_ytdlp_version)
+        if self.is_hwaccel_enabled():
+            self.warmup_futures["显卡检测"] = submit("显卡检测", self._get_gpu_vendor)
+            self.warmup_futures["编码器探测"] = submit("编码器探测", self._warm_encoders)
+        return self.warmup_futures
+
+    def _warm_ytdlp(self):
+        with self.metrics.span(STAGE_STAGING, detail="yt-dlp") as span:
+            self.yt_dlp_path = self.resolve_ytdlp_path()
+            span.bytes = self._file_size(self.yt_dlp_path)
+        return self.yt_dlp_path
+
+    def _warm_ffmpeg(self):
+        with self.metrics.span(STAGE_STAGING, detail="ffmpeg") as span:
+            self.ffmpeg_path = self.resolve_ffmpeg_path()
+            span.bytes = self._file_size(self.ffmpeg_path)
+        return self.ffmpeg_path
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path) if path else 0
+        except OSError:
+            return 0
+
+    def _check_ytdlp_version(self):
+        yt_dlp = self.tool_futures["yt-dlp 暂存"].result()
+        try:
+            r = subprocess.run(
+                [yt_dlp, "--version"],
+                capture_output=True,
+                text=True,
+                encoding=self.get_subprocess_encoding(),
+                errors="replace",
+                timeout=15,
+                stdin=subprocess.DEVNULL,
+                creationflags=self.get_creationflags(),
+            )
+        except Exception as e:
+            self.log(f"无法运行 yt-dlp: {str(e)}")
+            return None
+        version = (r.stdout or "").strip()
+        if r.returncode == 0 and version:
+            self.log(f"yt-dlp 版本: {version}")
+            return version
+        self.log(f"yt-dlp 版本检查失败（exit {r.returncode}）")
+        return None
+
+    def _warm_encoders(self):
+        self.tool_futures["ffmpeg 暂存"].result()
+        ffmpeg_exe = self.get_ffmpeg_executable()
+        if not ffmpeg_exe:
+            return None
+        return self._pick_video_encoder(ffmpeg_exe)
+
+    def is_tools_ready(self):
+        return bool(self.tool_futures) and all(f.done() for f in self.tool_futures.values())
+
+    def wait_ready(self, timeout=None):
+        if not self.tool_futures:
+            self.start_warmup()
+        wait_futures(list(self.tool_futures.values()), timeout=timeout)
+        return self.is_tools_ready()
+
+    def wait_warmup(self, timeout=None):
+        wait_futures(list(self.warmup_futures.values()), timeout=timeout)
+        if self.warmup_pool is not None:
+            self.warmup_pool.shutdown(wait=False)
+        for name, future in self.warmup_futures.items():
+            if future.done() and future.exception() is not None:
+                self.log(f"预热任务失败（{name}）: {str(future.exception())}")
+
+    def get_default_download_path(self):
+        if os.name == 'nt':
+            return os.path.join(os.path.expanduser("~"), "Downloads")
+        else:
+            return os.path.join(os.path.expanduser("~"), "Downloads")
+
+    def get_default_max_jobs(self):
+        try:
+            return max(1, int(os.environ.get("YTD_MAX_JOBS", "3")))
+        except ValueError:
+            return 3
+
+    def get_default_transcode_workers(self):
+        try:
+            return max(1, int(os.environ.get("YTD_TRANSCODE_WORKERS", "2")))
+        except ValueError:
+            return 2
+
+    def get_prefetch_workers(self):
+        try:
+            return max(0, int(os.environ.get("YTD_PREFETCH_WORKERS", "4")))
+        except ValueError:
+            return 4
+
+    def get_prefetch_per_host(self):
+        try:
+            return max(1, int(os.environ.get("YTD_PREFETCH_PER_HOST", "2")))
+        except ValueError:
+            return 2
+
+    def get_transcode_segments(self, duration):
+        """Parallel CPU encode segments for a video this long, 0 for one ffmpeg process.
+
+        Off unless YTD_TRANSCODE_SEGMENTS is set: ``auto`` (half the CPU cores)
+        or a count, for videos of at least YTD_SEGMENT_MIN_SECONDS.
+        """
+        v = os.environ.get("YTD_TRANSCODE_SEGMENTS", "0").strip().lower()
+        if v in ("0", "false", "off", "no"):
+            return 0
+        if v == "auto":
+            count = (os.cpu_count() or 1) // 2
+        else:
+            try:
+                count = int(v)
+            except ValueError:
+                return 0
+        try:
+            min_seconds = float(os.environ.get("YTD_SEGMENT_MIN_SECONDS", "300"))
+        except ValueError:
+            min_seconds = 300
+        if not duration or duration < min_seconds:
+            return 0
+        count = min(count, int(duration // 30))
+        return count if count >= 2 else 0
+
+    def submit(self, url, download_path=None, priority=PRIORITY_NORMAL, parent=None, audio_only=None):
+        if audio_only is None:
+            audio_only = parent.audio_only if parent is not None else False
+        job = DownloadJob(
+            url, download_path or self.download_path, priority=priority,
+            parent_id=parent.id if parent is not None else None, audio_only=audio_only,
+        )
+        job.journal_id = new_journal_id()
+        self.journal.append(
+            job.journal_id, "submit", url=url, download_path=job.download_path, priority=priority,
+            parent=parent.journal_id if parent is not None else None, audio_only=audio_only,
+        )
+        self._enqueue(job, parent)
+        self.job_log(job, f"已加入队列: {url}")
+        return job
+
+    def _enqueue(self, job, parent=None):
+        if parent is not None:
+            parent.child_ids.append(job.id)
+            parent.child_urls.add(job.url)
+        job.on_state = self._on_job_state
+        self.scheduler.submit(job)
+
+    def resume_jobs(self):
+        """Requeue the jobs the journal shows as interrupted by a crash or exit; returns them."""
+        if self.journal.busy:
+            self.log("另一个实例正在使用任务日志，本实例不恢复也不记录任务")
+            return []
+        entries = self.journal.replay()
+        now = time.time()
+        for entry in entries:
+            path = entry["info_path"]
+            if path and (not os.path.exists(path) or now - (entry["info_time"] or 0) > RESUME_INFO_MAX_AGE):
+                entry["info_path"] = None
+            for source, record in list(entry["records"].items()):
+                if not self._resume_record(record):
+                    del entry["records"][source]
+        # Rewrites the journal with just these jobs, so they keep their ids and
+        # do not log a second "submit".
+        self.journal.compact(entries)
+
+        by_id = {}
+        resumed = []
+        for entry in entries:
+            if not entry["url"]:
+                continue
+            parent = by_id.get(entry["parent"])
+            job = DownloadJob(
+                entry["url"], entry["download_path"] or self.download_path,
+                priority=entry["priority"] if entry["priority"] is not None else PRIORITY_NORMAL,
+                parent_id=parent.id if parent is not None else None, audio_only=entry["audio_only"],
+            )
+            job.journal_id = entry["id"]
+            for record in entry["records"].values():
+                job.manifest[record["source"]] = record
+            if entry["info_path"]:
+                job.resume_info = MediaInfo.load(job.url, entry["info_path"])
+            pending = [r for r in job.manifest.values() if r["output"] is None]
+            job.resume_transcodes_only = entry["state"] == JOB_TRANSCODING and bool(job.manifest)
+            by_id[job.journal_id] = job
+            detail = f"已完成 {len(job.manifest) - len(pending)} 个文件" if job.manifest else "尚无完成的文件"
+            if pending:
+                detail += f"，{len(pending)} 个待转码"
+            self.job_log(job, f"恢复中断的任务: {job.url}（{detail}）")
+            self._enqueue(job, parent)
+            # Only playlist entries are prefetched; a playlist would be enumerated twice.
+            prefetch = job.resume_info is None and not job.resume_transcodes_only
+            if entry["parent"] and prefetch and self.prefetcher is not None:
+                job.prefetch = self.prefetcher.submit(host_key(job.url), self._prefetch_entry, job)
+            resumed.append(job)
+        return resumed
+
+    def compact_journal(self):
+        """Drop finished jobs from the journal; unfinished ones stay for the next resume."""
+        self.journal.compact(self.journal.replay())
+
+    @staticmethod
+    def _resume_record(record):
+        """Check a journaled output against the disk; False drops it so the file is fetched again."""
+        if record.get("output"):
+            return os.path.exists(record["output"])
+        if os.path.exists(record["source"]):
+            return True
+        # The source is only removed once its conversion has finished.
+        converted = os.path.splitext(record["source"])[0] + ".mp4"
+        if os.path.exists(converted):
+            record["output"] = converted
+            return True
+        return False
+
+    def _on_job_state(self, job):
+        self.journal.append(job.journal_id, "state", state=job.state)
+        self._rebalance_bandwidth()
+        self.emit(EVENT_JOB_STATE, job, state=job.state)
+
+    def get_default_bandwidth_limit(self):
+        return parse_rate(os.environ.get("YTD_RATE_LIMIT", ""))
+
+    def set_bandwidth_limit(self, limit):
+        self.bandwidth_limit = max(0, int(limit or 0))
+        self._rebalance_bandwidth()
+
+    def _rebalance_bandwidth(self):
+        with self.bandwidth_lock:
+            jobs = [j for j in list(self.scheduler.jobs.values()) if j.state == JOB_DOWNLOADING]
+            if self.bandwidth_limit <= 0:
+                for job in jobs:
+                    job.rate_limit = 0
+                return
+            total = sum(PRIORITY_WEIGHTS.get(j.priority, 1) for j in jobs)
+            for job in jobs:
+                share = self.bandwidth_limit * PRIORITY_WEIGHTS.get(job.priority, 1) / total
+                job.rate_limit = max(RATE_LIMIT_MIN, int(share))
+
+    def _needs_rate_restart(self, job):
+        target, applied = job.rate_limit, job.applied_rate_limit
+        if target == applied:
+            return False
+        decrease = not applied or (target and target < applied)
+        interval = RATE_DECREASE_MIN_INTERVAL if decrease else RATE_INCREASE_MIN_INTERVAL
+        if time.monotonic() - job.rate_applied_at < interval:
+            return False
+        if not target or not applied:
+            return True
+        return abs(target - applied) / applied > RATE_RESTART_THRESHOLD
+
+    def _rate_limit_args(self, job, tuning):
+        job.applied_rate_limit = job.rate_limit
+        job.rate_applied_at = time.monotonic()
+        if not job.rate_limit:
+            return []
+        # yt-dlp enforces --limit-rate per connection, and fragmented downloads
+        # open up to --concurrent-fragments of them at once.
+        connections = tuning.fragments if tuning.fragmented else 1
+        return ["--limit-rate", str(max(RATE_LIMIT_MIN, job.rate_limit // max(1, connections)))]
+
+    def set_max_jobs(self, max_jobs):
+        self.scheduler.set_max_workers(max_jobs)
+
+    def set_transcode_workers(self, workers):
+        self.transcode_pool.set_max_workers(workers)
+
+    def throughput(self):
+        return self.scheduler.throughput()
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.scheduler.is_idle():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+
+    def _kill_tree(self, proc):
+        if not proc:
+            return
+        try:
+            if proc.poll() is not None:
+                return
+        except Exception:
+            return
+
+        if os.name == "nt":
+            try:
+                pid = proc.pid
+                subprocess.run(
+                    ["taskkill", "/F", "/T", "/PID", str(pid)],
+                    capture_output=True,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    timeout=5,
+                    creationflags=self.get_creationflags(),
+                )
+            except Exception:
+                pass
+        else:
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+
+        try:
+            if proc.poll() is None:
+                proc.kill()
+        except Exception:
+            pass
+
+    def stop_job(self, job_id):
+        job = self.scheduler.cancel(job_id)
+        if job is None:
+            return
+        self.job_log(job, "正在终止任务（下载/合并/转码）...")
+        for proc in list(job.transcode_processes):
+            self._kill_tree(proc)
+        self._kill_tree(job.current_process)
+        self._drop_prefetch(job)
+        self.job_log(job, "已发送终止信号")
+        for child_id in list(job.child_ids):
+            self.stop_job(child_id)
+
+    def stop_all(self):
+        for job_id in list(self.scheduler.jobs):
+            self.stop_job(job_id)
+
+    def _fetch_media_info(self, url, job=None, on_entry=None):
+        """Resolve ``url`` with a streaming ``-j --flat-playlist --lazy-playlist`` reader.
+
+        A single video prints one full info line. A playlist prints one flat
+        entry per line as the extractor pages through it (without
+        ``--lazy-playlist`` yt-dlp collects every page first); each is handed
+        to ``on_entry`` as soon as it arrives. Lazily enumerated entries may
+        not know the playlist size, in which case it is the number received.
+        """
+        cmd = [self.yt_dlp_path, "-j", "--flat-playlist", "--lazy-playlist", "--no-warnings", url]
+        with self.metrics.span(STAGE_RESOLVE, job, detail=url) as span:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding=self.get_subprocess_encoding(),
+                errors="replace",
+                stdin=subprocess.DEVNULL,
+                bufsize=1,
+                creationflags=self.get_creationflags(),
+                startupinfo=self.get_startupinfo(),
+            )
+            if job is not None:
+                job.current_process = proc
+            stderr_tail = collections.deque(maxlen=20)
+            last_output = [time.monotonic()]
+            stalled = threading.Event()
+
+            def drain_stderr():
+                for line in proc.stderr:
+                    last_output[0] = time.monotonic()
+                    stderr_tail.append(line.strip())
+
+            def watch():
+                while proc.poll() is None:
+                    if time.monotonic() - last_output[0] > RESOLVE_STALL_TIMEOUT:
+                        stalled.set()
+                        self._kill_tree(proc)
+                        return
+                    time.sleep(0.5)
+
+            threading.Thread(target=drain_stderr, daemon=True).start()
+            threading.Thread(target=watch, daemon=True).start()
+
+            single = None
+            playlist = None
+            try:
+                for line in proc.stdout:
+                    last_output[0] = time.monotonic()
+                    line = line.strip()
+                    if not line.startswith("{"):
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    span.bytes += len(line)
+                    if single is not None or not isinstance(data, dict):
+                        continue
+                    if playlist is None and not MediaInfo.is_playlist_entry(data):
+                        single = data
+                        continue
+                    if playlist is None:
+                        playlist = {
+                            "_type": "playlist",
+                            "id": data.get("playlist_id"),
+                            "title": data.get("playlist_title") or data.get("playlist"),
+                            "webpage_url": data.get("playlist_webpage_url") or url,
+                            "playlist_count": MediaInfo.playlist_count(data),
+                            "entries": [],
+                        }
+                    playlist["entries"].append(data)
+                    if playlist["playlist_count"] is None:
+                        playlist["playlist_count"] = MediaInfo.playlist_count(data)
+                    if on_entry is not None:
+                        on_entry(data)
+            finally:
+                if job is not None and job.is_cancelled:
+                    self._kill_tree(proc)
+                proc.wait()
+                if job is not None:
+                    job.current_process = None
+            span.set_exit(proc.returncode)
+
+        if playlist is not None and playlist["playlist_count"] is None:
+            playlist["playlist_count"] = len(playlist["entries"])
+        data = single or playlist
+        if stalled.is_set():
+            message = f"yt-dlp 超过 {RESOLVE_STALL_TIMEOUT:.0f} 秒没有输出"
+        else:
+            message = stderr_tail[-1] if stderr_tail else f"exit {proc.returncode}"
+        if data is None:
+            raise RuntimeError(message)
+        if proc.returncode != 0 and job is not None:
+            self.job_log(job, f"解析未完整结束（{message}），使用已得到的结果")
+        return MediaInfo(url, data)
+
+    def _discard_media_info(self, job):
+        info = job.media_info
+        job.media_info = None
+        if info is not None:
+            info.discard()
+
+    def resolve_url(self, job):
+        url = job.url
+        self.job_log(job, "正在解析视频地址...")
+        self._discard_media_info(job)
+        try:
+            info = self._fetch_media_info(url, job, on_entry=lambda entry: self._queue_entry(job, entry))
+        except Exception as e:
+            self.job_log(job, f"解析失败，但将尝试直接下载: {str(e)}")
+            self._set_resolved_url(job, url, is_direct=False)
+            return True
+
+        self._use_media_info(job, info)
+        return True
+
+    def _use_media_info(self, job, info):
+        url = job.url
+        job.media_info = info
+        self.job_log(job, f"解析成功: {url}")
+        if info.title:
+            self.job_log(job, f"标题: {info.title}")
+
+        if info.is_playlist:
+            self.job_log(job, f"播放列表枚举完成，共 {len(info.entries)} 个视频")
+            self._set_resolved_url(job, url, is_direct=False)
+        elif job.audio_only:
+            audio = info.best_audio()
+            if audio is not None:
+                self._set_resolved_url(job, audio.get("url") or url, is_direct=bool(audio.get("url")))
+                bitrate = audio.get("abr") or audio.get("tbr")
+                size = info.format_size(audio)
+                self.job_log(
+                    job,
+                    f"仅音频：{audio.get('ext') or '?'} {audio.get('acodec') or ''}"
+                    f"{f' {bitrate:.0f} kbit/s' if bitrate else ''}"
+                    f"{f'，预计 {size / 1024 / 1024:.1f} MiB' if size else ''}",
+                )
+            else:
+                self._set_resolved_url(job, url, is_direct=False)
+        else:
+            direct_lines = info.direct_urls()
+            if len(direct_lines) == 1:
+                self._set_resolved_url(job, direct_lines[0], is_direct=True)
+                self.job_log(job, "解析到合并直链（可能清晰度较低）")
+            elif direct_lines:
+                self._set_resolved_url(job, direct_lines[0], is_direct=True)
+                self.job_log(job, "检测到分离的音视频直链，已填入视频直链，音频直链见日志")
+                for idx, link in enumerate(direct_lines, 1):
+                    self.job_log(job, f"直链{idx}: {link}")
+            else:
+                self._set_resolved_url(job, url, is_direct=False)
+
+            size = info.estimated_size()
+            if size:
+                self.job_log(job, f"预计大小: {size / 1024 / 1024:.1f} MiB（{len(info.formats)} 个可用格式）")
+
+        # Playlist entries run as their own jobs, so only single videos reuse the info.
+        if not info.is_playlist:
+            if info.save(self.get_info_dir()):
+                self.journal.append(job.journal_id, "info", path=info.info_path)
+            else:
+                self.job_log(job, "保存解析结果失败，下载时将重新解析")
+
+    def _prefetch_entry(self, job):
+        if job.is_cancelled or job.state != JOB_QUEUED:
+            return None
+        info = self._fetch_media_info(job.url, job)
+        # Nested playlists are expanded by the job itself.
+        if info.is_playlist or job.is_cancelled or not info.save(self.get_info_dir()):
+            info.discard()
+            return None
+        return info, time.monotonic()
+
+    def _drop_prefetch(self, job):
+        future = job.prefetch
+        job.prefetch = None
+        if future is None or future.cancel() or not future.done() or future.exception() is not None:
+            return
+        if future.result() is not None:
+            future.result()[0].discard()
+
+    def _take_prefetched(self, job):
+        """Adopt the prefetched info for ``job``; False means it has to resolve itself."""
+        future = job.prefetch
+        job.prefetch = None
+        # A prefetch that has not started yet would only delay the job.
+        if future is None or future.cancel():
+            return False
+        started = time.perf_counter()
+        try:
+            result = future.result()
+        except Exception as e:
+            self.job_log(job, f"预取解析失败（{str(e)}），重新解析")
+            return False
+        if result is None:
+            return False
+        info, fetched_at = result
+        age = time.monotonic() - fetched_at
+        if age > PREFETCH_MAX_AGE:
+            info.discard()
+            self.job_log(job, f"预取的解析结果已过去 {age / 60:.0f} 分钟，重新解析")
+            return False
+        waited = time.perf_counter() - started
+        if waited >= 0.05:
+            self.job_log(job, f"使用预取的解析结果（等待预取 {waited:.1f} 秒）")
+        else:
+            self.job_log(job, f"使用预取的解析结果（{age:.0f} 秒前完成）")
+        self._use_media_info(job, info)
+        return True
+
+    def _queue_entry(self, job, entry):
+        """Submit one enumerated playlist entry as its own job while enumeration continues."""
+        if job.is_cancelled:
+            return
+        job.entries_found += 1
+        if job.entries_found == 1:
+            title = entry.get("playlist_title") or entry.get("playlist") or ""
+            count = MediaInfo.playlist_count(entry)
+            self.job_log(
+                job,
+                f"检测到播放列表{'：' + title if title else ''}"
+                f"{f'（{count} 个视频）' if count else ''}，边枚举边加入队列",
+            )
+            # Enumeration mostly waits on the site; let the entries use the slot.
+            self.scheduler.release(job)
+
+        entry_url = entry.get("webpage_url") or entry.get("url")
+        # Entries resumed from the journal are already queued.
+        if entry_url in job.child_urls:
+            return
+        key = MediaInfo.entry_key(entry)
+        archived = self.archive.lookup_existing(*key, job.archive_kind) if key else None
+        if archived is not None:
+            job.files.append(archived["output_path"])
+            return
+        if not entry_url:
+            self.job_log(job, f"播放列表第 {job.entries_found} 项没有可用链接，跳过")
+            return
+        child = self.submit(entry_url, job.download_path, priority=job.priority, parent=job)
+        if self.prefetcher is not None:
+            child.prefetch = self.prefetcher.submit(host_key(entry_url), self._prefetch_entry, child)
+
+    def convert_to_mp4(self, job, input_file):
+        if job.is_cancelled:
+            return input_file
+        self.job_log(job, f"正在转换文件: {input_file}")
+
+        input_ext = os.path.splitext(input_file)[1].lower()
+        if input_ext in AUDIO_PASSTHROUGH_EXTS:
+            self.job_log(job, f"跳过转换（音频文件）: {input_file}")
+            return input_file
+
+        output_file = os.path.splitext(input_file)[0] + ".mp4"
+        
+        try:
+            ffmpeg_exe = self.get_ffmpeg_executable()
+            if not ffmpeg_exe:
+                self.job_log(job, "未找到 ffmpeg，跳过转换；请将 ffmpeg.exe 放到程序同目录或安装到 PATH。")
+                return input_file
+
+            probe = self._probe_media(ffmpeg_exe, input_file)
+            if probe is None:
+                self.job_log(job, "无法探测输入流，将完整转码")
+            else:
+                self.job_log(
+                    job,
+                    f"输入流：视频 {', '.join(probe['video']) or '无'}，音频 {', '.join(probe['audio']) or '无'}",
+                )
+
+            prefer_hw = self.is_hwaccel_enabled()
+            cpu_profile = self.get_cpu_encode_profile(ffmpeg_exe, probe)
+            cmd, encoder, note = self._build_transcode_cmd(
+                ffmpeg_exe, input_file, output_file, prefer_hw=prefer_hw, probe=probe, cpu_profile=cpu_profile
+            )
+            copy_video, copy_audio = self._plan_stream_copy(probe)
+            cpu_label = f"{cpu_profile.name}，{cpu_profile.reason}"
+            if copy_video and copy_audio:
+                self.job_log(job, "转码：音视频编码兼容 MP4，直接封装（不重新编码）")
+            elif copy_video:
+                self.job_log(job, "转码：视频直接复制，仅重新编码音频（aac）")
+            elif prefer_hw:
+                if encoder not in CPU_ENCODERS:
+                    self.job_log(job, f"转码：使用硬件编码器 {encoder}（失败将回退 CPU）")
+                else:
+                    if note:
+                        self.job_log(job, f"转码：硬件编码不可用（{note}），使用 CPU（{cpu_label}）")
+                    else:
+                        self.job_log(job, f"转码：未检测到可用硬件编码器，使用 CPU（{cpu_label}）")
+            else:
+                self.job_log(job, f"转码：已禁用硬件编码（YTD_HWACCEL=0），使用 CPU（{cpu_label}）")
+            if copy_audio and not copy_video:
+                self.job_log(job, "转码：音频直接复制，仅重新编码视频")
+
+            cache_key = None
+            if self.transcode_cache.enabled:
+                try:
+                    cache_key = self.transcode_cache.make_key(
+                        input_file, cmd, output_file, self.get_tool_fingerprint(ffmpeg_exe)
+                    )
+                except Exception:
+                    cache_key = None
+            if cache_key:
+                method = self.transcode_cache.fetch(cache_key, output_file)
+                if method:
+                    self.job_log(job, f"转码缓存命中（{method}），跳过 ffmpeg: {output_file}")
+                    os.remove(input_file)
+                    return output_file
+
+            # The output may be a hardlink into the transcode cache; ffmpeg -y
+            # truncates in place, so unlink it first to keep the cache intact.
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+            progress = None
+            if not copy_video and encoder in CPU_ENCODERS and probe and probe["video"]:
+                segments = self.get_transcode_segments(probe["duration"])
+                if segments:
+                    progress = self._transcode_segmented(
+                        job, ffmpeg_exe, input_file, output_file, probe, copy_audio, segments, cpu_profile
+                    )
+                    if job.is_cancelled:
+                        return input_file
+                    if progress is None:
+                        self.job_log(job, "分段转码未成功，改用单进程转码")
+
+            if progress is None:
+                attempts = [cmd]
+                if encoder not in CPU_ENCODERS or copy_audio:
+                    cpu_cmd, _, _ = self._build_transcode_cmd(
+                        ffmpeg_exe, input_file, output_file, prefer_hw=False, cpu_profile=cpu_profile
+                    )
+                    attempts.append(cpu_cmd)
+
+                for attempt, last_cmd in enumerate(attempts):
+                    if attempt:
+                        self.job_log(job, f"转码失败，正在回退 CPU（{cpu_profile.name}）完整转码重试...")
+                    label = cpu_profile.name if attempt or encoder in CPU_ENCODERS else encoder
+                    progress = TranscodeProgress(input_file, label, probe and probe["duration"])
+                    job.transcode_progress = progress
+                    returncode = self._run_ffmpeg(job, last_cmd, progress)
+                    if job.is_cancelled:
+                        return input_file
+                    if returncode == 0:
+                        break
+                else:
+                    raise subprocess.CalledProcessError(
+                        returncode=returncode,
+                        cmd=' '.join(last_cmd)
+                    )
+
+            self._record_transcode_stats(job, progress, output_file)
+            
+            if os.path.exists(output_file):
+                if cache_key:
+                    self.transcode_cache.store(cache_key, output_file)
+                os.remove(input_file)
+                return output_file
+            else:
+                return input_file
+        except Exception as e:
+            self.job_log(job, f"转换失败: {str(e)}")
+            return input_file
+
+    def get_transcode_stats_path(self):
+        if not self.tools_dir:
+            return None
+        return os.path.join(self.tools_dir, "transcode-stats.jsonl")
+
+    def _record_transcode_stats(self, job, progress, output_file):
+        progress.elapsed = time.perf_counter() - progress.started
+        try:
+            output_size = os.path.getsize(output_file)
+        except Exception:
+            output_size = 0
+        stats = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "encoder": progress.encoder,
+            "input": os.path.basename(progress.input_file),
+            "duration": round(progress.duration, 3),
+            "elapsed": round(progress.elapsed, 3),
+            "frames": progress.frame,
+            "fps": round(progress.average_fps, 2),
+            "realtime": round(progress.realtime_factor, 2),
+            "output_size": output_size,
+        }
+        self.job_log(
+            job,
+            f"转码完成：{stats['encoder']}，用时 {stats['elapsed']:.1f} 秒，"
+            f"{stats['fps']:.1f} fps，{stats['realtime']:.2f}x 实时",
+        )
+        path = self.get_transcode_stats_path()
+        if not path:
+            return
+        try:
+            with self.transcode_stats_lock:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(stats, ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+
+    def _queue_transcode(self, job, record, transcodes):
+        file_path = record["source"]
+        with self.active_outputs_lock:
+            if file_path in self.active_outputs:
+                self.job_log(job, f"文件正由其他任务处理，跳过: {file_path}")
+                record["output"] = file_path
+                return
+            self.active_outputs.add(file_path)
+        transcodes[file_path] = self.transcode_pool.submit(self._post_process, job, record)
+
+    def _queue_pending_transcodes(self, job, transcodes):
+        # Outputs journaled before an interruption that were never converted.
+        for record in list(job.manifest.values()):
+            if record["output"] is None:
+                self._queue_transcode(job, record, transcodes)
+
+    def _post_process(self, job, record):
+        source = record["source"]
+        if source.lower().endswith('.mp4') or job.audio_only:
+            record["output"] = source
+        else:
+            with self.metrics.span(STAGE_TRANSCODE, job, detail=os.path.basename(source)) as span:
+                record["output"] = self.convert_to_mp4(job, source)
+                span.bytes = self._file_size(record["output"])
+                if job.is_cancelled:
+                    span.status = STATUS_CANCELLED
+                elif record["output"] == source and not source.lower().endswith(AUDIO_PASSTHROUGH_EXTS):
+                    span.status = STATUS_ERROR
+        if not job.is_cancelled:
+            self.journal.append(job.journal_id, "output", source=source, output=record["output"])
+        self._archive_record(job, record)
+        return record["output"]
+
+    def _archive_record(self, job, record):
+        output = record["output"]
+        if job.is_cancelled or not output or not os.path.exists(output):
+            return
+        urls = [record.get("webpage_url")]
+        if job.media_info is None or not job.media_info.is_playlist:
+            urls.append(job.url)
+        try:
+            size = os.path.getsize(output)
+        except Exception:
+            size = None
+        self.archive.record(
+            record["extractor"], record["id"], output, urls=urls, size=size, fmt=record.get("format"),
+            kind=job.archive_kind,
+        )
+
+    def _archived_outputs(self, keys, kind=KIND_VIDEO):
+        """(extractor, id) -> output path of the keys already downloaded and still on disk."""
+        found = collections.OrderedDict()
+        for extractor, video_id in keys:
+            item = self.archive.lookup_existing(extractor, video_id, kind)
+            if item is not None:
+                found[(extractor, video_id)] = item["output_path"]
+        return found
+
+    def _finish_archived(self, job, files):
+        job.files = files
+        self.job_log(job, f"已在下载记录中，跳过 {len(files)} 个文件")
+        job.set_state(JOB_DONE)
+
+    def _write_archive_snapshot(self, job, archived_keys=()):
+        # Even with nothing to skip the job gets its own archive file: yt-dlp
+        # appends finished entries to it, so a restart for a new rate limit does
+        # not fetch them again. Only this job's entries go in; the index was
+        # already checked for them, so the whole archive never needs dumping.
+        if not self.tools_dir:
+            return None
+        lines = [f"{extractor.lower()} {video_id}" for extractor, video_id in archived_keys]
+        # Entries finished before a resume may have had their source deleted
+        # by the conversion; keep yt-dlp from fetching them again.
+        lines += [
+            f"{r['extractor'].lower()} {r['id']}"
+            for r in job.manifest.values() if r["output"] and r.get("extractor") and r.get("id")
+        ]
+        try:
+            fd, path = tempfile.mkstemp(prefix=f"ytd-archive-{job.id}-", suffix=".txt", dir=self.tools_dir)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(line + "\n")
+        except Exception:
+            return None
+        return path
+
+    def _log_stage_summary(self, job):
+        stages = job.stage_summary
+        if not stages:
+            return
+        parts = []
+        for stage, entry in stages.items():
+            part = f"{STAGE_NAMES.get(stage, stage)} {entry['seconds']:.1f} 秒"
+            if entry["count"] > 1:
+                part += f"（{entry['count']} 次）"
+            parts.append(part)
+        self.job_log(job, f"阶段耗时：{'，'.join(parts)}")
+
+    def _release_outputs(self, job):
+        with self.active_outputs_lock:
+            for file_path in job.manifest:
+                self.active_outputs.discard(file_path)
+
+    def _cancel_transcodes(self, transcodes):
+        for future in transcodes.values():
+            future.cancel()
+
+    def run_job(self, job):
+        url = job.url
+        archive_path = None
+        try:
+            archived = self.archive.lookup_url(url, job.archive_kind)
+            if archived is not None and os.path.exists(archived["output_path"]):
+                self._finish_archived(job, [archived["output_path"]])
+                return
+
+            if job.resume_transcodes_only:
+                self.job_log(job, "下载已在中断前完成，继续未完成的转码")
+                transcodes = {}
+                self._queue_pending_transcodes(job, transcodes)
+                self._complete_job(job, transcodes)
+                return
+
+            job.set_state(JOB_RESOLVING)
+            if job.resume_info is not None:
+                info, job.resume_info = job.resume_info, None
+                self.job_log(job, "使用中断前保存的解析结果")
+                self._use_media_info(job, info)
+            elif not self._take_prefetched(job) and not self.resolve_url(job):
+                job.set_state(JOB_FAILED, "解析失败")
+                return
+            if job.is_cancelled:
+                return
+
+            if job.media_info is not None and job.media_info.is_playlist:
+                self.job_log(
+                    job,
+                    f"播放列表已展开：{len(job.child_ids)} 个视频加入队列，{len(job.files)} 个已在下载记录中",
+                )
+                job.set_state(JOB_DONE)
+                return
+
+            archived = {}
+            if job.media_info is not None:
+                keys = job.media_info.archive_keys()
+                archived = self._archived_outputs(keys, job.archive_kind)
+                archived_files = list(archived.values())
+                if keys and len(archived_files) == len(keys):
+                    self._finish_archived(job, archived_files)
+                    return
+                if archived_files:
+                    self.job_log(job, f"下载记录中已有 {len(archived_files)}/{len(keys)} 个视频，将跳过")
+                for _, video_id in archived:
+                    job.outcomes.skip(video_id)
+                info = job.media_info
+                if job.audio_only and not info.is_playlist and info.formats and info.best_audio() is None:
+                    job.set_state(JOB_FAILED, "没有单独的音频流，无法只下载音频")
+                    return
+
+            ffmpeg_exe = self.get_ffmpeg_executable()
+            if not ffmpeg_exe:
+                if job.audio_only:
+                    self.job_log(job, "警告: 未找到 ffmpeg；音频将保留下载时的容器格式（如 .webm）")
+                else:
+                    self.job_log(job, "警告: 未找到 ffmpeg；下载可能无法合并/转码。建议将 ffmpeg.exe 放到程序同目录或安装到 PATH。")
+
+            if self.is_hwaccel_enabled() and not job.audio_only:
+                vendor = self._get_gpu_vendor()
+                if vendor:
+                    self.job_log(job, f"检测到显卡类型: {vendor}（将尝试硬件编码加速转码）")
+                else:
+                    self.job_log(job, "未能识别显卡类型（将尝试自动探测 ffmpeg 硬件编码器）")
+
+            # Without resolved info there is no telling, and yt-dlp may well fragment.
+            fragmented = job.media_info is None or job.media_info.is_fragmented()
+            tuning = self.get_download_tuning(url, fragmented)
+            fragments = f"分片并发 {tuning.fragments}" if fragmented else "不分片"
+            self.job_log(
+                job,
+                f"下载参数（{tuning.host}，{tuning.reason}）：{fragments}，缓冲 {tuning.buffer_size}，"
+                f"重试 {tuning.retries}/{tuning.fragment_retries}",
+            )
+            
+            format_spec = AUDIO_FORMAT if job.audio_only else self._select_formats(job, ffmpeg_exe, tuning)
+            cmd = [
+                self.yt_dlp_path,
+                "-o", os.path.join(job.download_path, "%(title)s.%(ext)s"),
+                "-f", format_spec,
+                "--ignore-errors",
+                "--no-warnings",
+                "--newline",
+            ] + tuning.ytdlp_args() + [
+                "--progress",
+                "--no-simulate",
+                "--progress-template", PROGRESS_EVENT_TEMPLATE,
+                "--print", ENTRY_EVENT_TEMPLATE,
+                "--print", POSTPROCESS_EVENT_TEMPLATE,
+                "--print", FILE_EVENT_TEMPLATE,
+            ]
+
+            if ffmpeg_exe:
+                cmd.extend(["--ffmpeg-location", ffmpeg_exe])
+                if job.audio_only:
+                    cmd.extend(["-x", "--audio-format", "best"])
+            
+            if self.is_debug:
+                cmd.append("-v")
+
+            archive_path = self._write_archive_snapshot(job, archived)
+            if archive_path:
+                cmd.extend(["--download-archive", archive_path])
+            
+            info_path = job.media_info.info_path if job.media_info else None
+            target = ["--load-info-json", info_path] if info_path else [url]
+            
+            job.set_state(JOB_DOWNLOADING)
+            self.job_log(job, f"开始下载: {url}")
+            
+            output = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+            transcodes = {}
+            self._queue_pending_transcodes(job, transcodes)
+            retry_lines = 0
+            requests = 0
+            rate_limited = False
+            download_started = time.perf_counter()
+            while True:
+                run_cmd = cmd + self._rate_limit_args(job, tuning) + target
+                rate_limited = rate_limited or bool(job.applied_rate_limit)
+                self.job_log(job, f"下载命令: {' '.join(run_cmd)}")
+                download_span = self.metrics.start(STAGE_DOWNLOAD, job, detail=tuning.host)
+                run_bytes = job.transferred_bytes
+                merges = {}
+                job.current_process = subprocess.Popen(
+                    run_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    encoding=self.get_subprocess_encoding(),
+                    errors="replace",
+                    stdin=subprocess.DEVNULL,
+                    bufsize=1,
+                    creationflags=self.get_creationflags(),
+                    startupinfo=self.get_startupinfo()
+                )
+                proc = job.current_process
+                restart = False
+                while True:
+                    if job.is_cancelled:
+                        break
+                    if self._needs_rate_restart(job):
+                        restart = True
+                        self._kill_tree(proc)
+                        break
+                    line = proc.stdout.readline()
+                    if not line:
+                        break
+                    stripped_line = line.strip()
+                    event = parse_ytdlp_event(stripped_line)
+
+                    if isinstance(event, ProgressEvent):
+                        if event.filename != job.current_file:
+                            requests += event.fragment_count or 1
+                        job.apply_progress(event)
+                        continue
+
+                    if is_download_error(stripped_line):
+                        retry_lines += 1
+
+                    if self.is_debug:
+                        self.job_log(job, stripped_line)
+                    output.append(stripped_line)
+                    job.outcomes.feed(stripped_line, event)
+
+                    if isinstance(event, FileEvent):
+                        merge_span = merges.pop(event.entry_id, None)
+                        if merge_span is not None:
+                            merge_span.bytes = self._file_size(event.filepath)
+                            self.metrics.finish(merge_span, job)
+                        record = job.record_output(event)
+                        if record is not None:
+                            self.journal.append(job.journal_id, "file", record=record)
+                            self._queue_transcode(job, record, transcodes)
+                    elif isinstance(event, PostProcessEvent):
+                        merges[event.entry_id] = self.metrics.start(
+                            STAGE_MERGE, job, detail=event.entry_id or "", parent=download_span
+                        )
+                    elif isinstance(event, EntryEvent):
+                        if event.urls and not job.resolved_is_direct:
+                            self._set_resolved_url(job, event.urls[0], is_direct=True)
+                            self.job_log(job, f"提取到真实下载地址: {job.resolved_url}")
+                
+                proc.wait()
+                unfinished = STATUS_CANCELLED if job.is_cancelled else STATUS_RESTARTED if restart else STATUS_ERROR
+                for merge_span in merges.values():
+                    self.metrics.finish(merge_span, job, unfinished)
+                download_span.bytes = job.transferred_bytes - run_bytes
+                download_span.set_exit(proc.returncode)
+                self.metrics.finish(
+                    download_span, job, unfinished if job.is_cancelled or restart else None
+                )
+                if not restart or job.is_cancelled:
+                    break
+                self.job_log(
+                    job,
+                    f"带宽分配由 {format_rate_limit(job.applied_rate_limit)} 调整为 {format_rate_limit(job.rate_limit)}"
+                    f"（实际 {format_rate(job.speed)}），续传重启下载",
+                )
+
+            download_seconds = time.perf_counter() - download_started
+            if rate_limited:
+                self.job_log(
+                    job,
+                    f"下载平均 {format_rate(job.transferred_bytes / max(download_seconds, 1e-6))}，"
+                    f"带宽分配 {format_rate_limit(job.applied_rate_limit)}",
+                )
+            # Throughput under a bandwidth budget says nothing about the host, so
+            # only unthrottled runs feed the tuner; a failure only counts against
+            # the setting when transport errors (retries, 403/429, skipped
+            # fragments) came with it.
+            if self.tuner is not None and not job.is_cancelled and not rate_limited:
+                speed = self.tuner.record(
+                    tuning, job.transferred_bytes, download_seconds, retry_lines, requests,
+                    failed=proc.returncode != 0 and not job.manifest,
+                )
+                if speed:
+                    self.job_log(job, f"本次平均速度 {speed / 1024 / 1024:.2f} MiB/s，重试 {retry_lines} 次")
+
+            if job.is_cancelled:
+                self._cancel_transcodes(transcodes)
+                self.job_log(job, "任务已终止")
+                return
+            
+            job.outcomes.finish(proc.returncode)
+            failed = job.outcomes.failed()
+            for entry_id, entry in failed:
+                self.job_log(job, f"{entry['title'] or entry_id} 下载失败：{entry['error']}")
+            if proc.returncode != 0 or failed:
+                if job.manifest:
+                    # Partial success: the job completes, but the failures stay on it.
+                    total = len(job.outcomes.entries)
+                    if failed:
+                        job.error = f"{len(failed)}/{total} 个视频失败：{job.outcomes.first_error()}"
+                    else:
+                        job.error = f"yt-dlp 退出码 {proc.returncode}"
+                    self.job_log(job, f"已完成 {len(job.manifest)} 个文件，{job.error}")
+                else:
+                    raise subprocess.CalledProcessError(
+                        returncode=proc.returncode,
+                        cmd=' '.join(run_cmd),
+                        output='\n'.join(output)
+                    )
+            
+            self._complete_job(job, transcodes, download_seconds)
+        except subprocess.CalledProcessError as e:
+            self.job_log(job, f"下载失败: {e.output}")
+            lines = e.output.strip().splitlines()
+            job.set_state(JOB_FAILED, job.outcomes.first_error() or (lines[-1] if lines else f"exit {e.returncode}"))
+        except Exception as e:
+            self.job_log(job, f"下载错误: {str(e)}")
+            job.set_state(JOB_FAILED, str(e))
+        finally:
+            with self.metrics.span(STAGE_CLEANUP, job):
+                self._release_outputs(job)
+                self._drop_prefetch(job)
+                self._discard_media_info(job)
+                if job.resume_info is not None:
+                    job.resume_info.discard()
+                    job.resume_info = None
+                if archive_path:
+                    try:
+                        os.remove(archive_path)
+                    except Exception:
+                        pass
+            job.current_process = None
+            self._log_stage_summary(job)
+
+    def _complete_job(self, job, transcodes, download_seconds=None):
+        job.set_state(JOB_TRANSCODING)
+        wait_started = time.perf_counter()
+        for future in transcodes.values():
+            if job.is_cancelled:
+                break
+            future.result()
+
+        if job.is_cancelled:
+            self._cancel_transcodes(transcodes)
+            self.job_log(job, "任务已终止")
+            return
+
+        if transcodes and download_seconds is not None and not job.audio_only:
+            self.job_log(
+                job,
+                f"下载用时 {download_seconds:.1f} 秒，下载结束后等待转码 {time.perf_counter() - wait_started:.1f} 秒",
+            )
+
+        if not job.manifest:
+            self.job_log(job, "任务已结束：yt-dlp 未报告任何输出文件。")
+
+        job.files = job.output_files
+        total_files = len(job.files)
+        if total_files:
+            self.job_log(job, f"成功下载 {total_files} 个文件")
+        job.set_state(JOB_DONE)
@@ -0,0 +1,217 @@
+"""Score the formats a video is offered in and pick the pair that reaches an mp4 soonest."""
+
+# yt-dlp codec strings (avc1.640028, vp09.00.40.08, mp4a.40.2, ...) by prefix,
+# mapped to the ffprobe codec names the transcode step uses.
+VIDEO_CODEC_PREFIXES = (
+    ("avc1", "h264"), ("avc3", "h264"), ("h264", "h264"),
+    ("hev1", "hevc"), ("hvc1", "hevc"), ("hevc", "hevc"), ("h265", "hevc"),
+    ("av01", "av1"), ("av1", "av1"),
+    ("vp09", "vp9"), ("vp9", "vp9"), ("vp8", "vp8"),
+)
+AUDIO_CODEC_PREFIXES = (
+    ("mp4a", "aac"), ("aac", "aac"), ("opus", "opus"), ("mp3", "mp3"),
+    ("vorbis", "vorbis"), ("ac-3", "ac3"), ("ec-3", "eac3"), ("flac", "flac"),
+)
+
+# Re-encoding audio to aac is cheap next to video; only its order of magnitude matters.
+AUDIO_ENCODE_REALTIME = 100.0
+# Storyboards and manifests that are not media.
+SKIPPED_PROTOCOLS = ("mhtml",)
+# Streams yt-dlp merges straight into an .mp4 (anything else ends up in .mkv/.webm).
+MP4_EXTS = ("mp4", "m4a", "m4v", "mov")
+# A resolution step bought with a re-encode is worth at most this many seconds
+# of extra download + transcode time per second of video.
+RESOLUTION_STEP_SECONDS = 1.0
+
+
+def codec_name(codec, prefixes):
+    codec = (codec or "").lower()
+    if codec in ("", "none"):
+        return None
+    for prefix, name in prefixes:
+        if codec.startswith(prefix):
+            return name
+    return codec.split(".")[0]
+
+
+def format_kbps(fmt):
+    return fmt.get("tbr") or (fmt.get("vbr") or 0) + (fmt.get("abr") or 0) or 0
+
+
+def format_bytes(fmt, duration):
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    return int(format_kbps(fmt) * 1000 / 8 * (duration or 0))
+
+
+class FormatChoice:
+    __slots__ = (
+        "spec", "video", "audio", "height", "video_codec", "audio_codec", "size",
+        "download_seconds", "transcode_seconds", "reencode", "mp4_ready", "reason",
+    )
+
+    def __init__(self, video, audio, duration, download_rate, transcode_speed, copy_video, copy_audio):
+        self.video = video
+        self.audio = audio
+        self.spec = f"{video['format_id']}+{audio['format_id']}" if audio is not None else str(video["format_id"])
+        self.height = video.get("height") or 0
+        self.video_codec = codec_name(video.get("vcodec"), VIDEO_CODEC_PREFIXES)
+        audio_source = audio if audio is not None else video
+        self.audio_codec = codec_name(audio_source.get("acodec"), AUDIO_CODEC_PREFIXES)
+        self.size = format_bytes(video, duration) + (format_bytes(audio, duration) if audio is not None else 0)
+        self.download_seconds = self.size / download_rate if download_rate > 0 else 0.0
+        self.transcode_seconds = 0.0
+        self.reencode = False
+        if self.video_codec not in copy_video:
+            self.reencode = True
+            if duration:
+                self.transcode_seconds += duration / max(transcode_speed(self.height), 0.01)
+        if self.audio_codec and self.audio_codec not in copy_audio:
+            self.reencode = True
+            if duration:
+                self.transcode_seconds += duration / AUDIO_ENCODE_REALTIME
+        self.mp4_ready = video.get("ext") in MP4_EXTS and (audio is None or audio.get("ext") in MP4_EXTS)
+        self.reason = ""
+
+    @property
+    def total_seconds(self):
+        return self.download_seconds + self.transcode_seconds
+
+    @property
+    def kbps(self):
+        return format_kbps(self.video) + (format_kbps(self.audio) if self.audio is not None else 0)
+
+    def describe(self):
+        codecs = "+".join(c for c in (self.video_codec, self.audio_codec) if c)
+        return f"{self.spec}（{self.height or '?'}p {codecs}，{self.size / 1024 / 1024:.1f} MiB）"
+
+
+def _is_media(fmt):
+    return bool(fmt.get("format_id")) and (fmt.get("protocol") or "") not in SKIPPED_PROTOCOLS
+
+
+def _best_per_codec(items, codec_of):
+    # Time only decides between codecs; within one codec the best stream wins.
+    best = {}
+    for item, kbps in items:
+        codec = codec_of(item)
+        if codec not in best or kbps > best[codec][1]:
+            best[codec] = (item, kbps)
+    return [item for item, _ in best.values()]
+
+
+def _within_cap(choice, max_height, max_kbps):
+    if max_height and choice.height > max_height:
+        return False
+    if max_kbps and choice.kbps and choice.kbps > max_kbps:
+        return False
+    return True
+
+
+def _size(choice):
+    return choice.height, choice.video.get("fps") or 0
+
+
+def _fastest_tallest(choices, tallest=True):
+    # The tallest (or, past the caps, smallest) size; among its codec pairs the best
+    # stream of each competes on time, near-equal times going to the pair that needs
+    # no remux afterwards.
+    size = (max if tallest else min)(_size(c) for c in choices)
+    tier = _best_per_codec(
+        [(c, c.kbps) for c in choices if _size(c) == size],
+        lambda c: (c.video_codec, c.audio_codec, c.audio is None),
+    )
+    return min(tier, key=lambda c: (round(c.total_seconds), not c.mp4_ready, -c.kbps))
+
+
+def _reason(best, runner_up, steps):
+    if best.transcode_seconds:
+        reason = f"预计下载 {best.download_seconds:.0f} 秒 + 转码 {best.transcode_seconds:.0f} 秒"
+    else:
+        reason = f"预计下载 {best.download_seconds:.0f} 秒，无需重新编码"
+    # Name the best option on the other side of the re-encode trade-off.
+    if runner_up is not None:
+        reason += f"；{runner_up.describe()} 需要 {runner_up.total_seconds:.0f} 秒"
+        if steps and runner_up.height > best.height:
+            reason += f"，多出的时间不值得提高 {steps} 档分辨率"
+    return reason
+
+
+def choose_formats(formats, duration, download_rate, transcode_speed, copy_video, copy_audio,
+                   max_height=0, max_kbps=0):
+    """Pick the video(+audio) formats to download, or None when nothing is usable.
+
+    Every pair within the caps is scored on estimated download plus transcode
+    time. The tallest pair that copies straight into an mp4 is the baseline; a
+    taller pair that has to be re-encoded (a 2160p VP9 over a 1080p H.264, say)
+    only wins when its extra time stays within RESOLUTION_STEP_SECONDS per
+    second of video for each resolution step it gains. At the same size the
+    faster pair wins, so a slow network can still pay for a re-encode.
+    mp4-compatible video is paired with m4a audio whenever there is one.
+    ``transcode_speed`` maps a height to the expected encode speed as a
+    multiple of realtime.
+    """
+    media = [f for f in formats if _is_media(f)]
+    videos = [f for f in media if codec_name(f.get("vcodec"), VIDEO_CODEC_PREFIXES)]
+    audios = _best_per_codec(
+        [
+            (f, format_kbps(f)) for f in media
+            if not codec_name(f.get("vcodec"), VIDEO_CODEC_PREFIXES)
+            and codec_name(f.get("acodec"), AUDIO_CODEC_PREFIXES)
+        ],
+        lambda f: codec_name(f.get("acodec"), AUDIO_CODEC_PREFIXES),
+    )
+    mp4_audios = [
+        a for a in audios
+        if a.get("ext") in MP4_EXTS and codec_name(a.get("acodec"), AUDIO_CODEC_PREFIXES) in copy_audio
+    ]
+
+    candidates = []
+    for video in videos:
+        if codec_name(video.get("acodec"), AUDIO_CODEC_PREFIXES) is not None:
+            pairs = [None]
+        elif mp4_audios and video.get("ext") in MP4_EXTS and \
+                codec_name(video.get("vcodec"), VIDEO_CODEC_PREFIXES) in copy_video:
+            pairs = mp4_audios
+        else:
+            pairs = audios
+        for audio in pairs:
+            candidates.append(
+                FormatChoice(video, audio, duration, download_rate, transcode_speed, copy_video, copy_audio)
+            )
+    if not candidates:
+        return None
+
+    capped = [c for c in candidates if _within_cap(c, max_height, max_kbps)]
+    if not capped:
+        # Everything is over the cap: take the smallest there is.
+        best = _fastest_tallest(candidates, tallest=False)
+        best.reason = _reason(best, None, 0) + "；所有格式都超过上限，取最小的"
+        return best
+
+    copied = [c for c in capped if not c.reencode]
+    encoded = [c for c in capped if c.reencode]
+    best_copy = _fastest_tallest(copied) if copied else None
+    best_encode = _fastest_tallest(encoded) if encoded else None
+    if best_copy is None or best_encode is None:
+        best = best_copy or best_encode
+        best.reason = _reason(best, None, 0)
+        return best
+
+    heights = sorted({c.height for c in capped})
+    steps = heights.index(best_encode.height) - heights.index(best_copy.height)
+    extra = best_encode.total_seconds - best_copy.total_seconds
+    if steps > 0:
+        best = best_encode if extra <= steps * RESOLUTION_STEP_SECONDS * (duration or 0) else best_copy
+    elif steps == 0:
+        best = min(
+            (best_copy, best_encode),
+            key=lambda c: (round(c.total_seconds), not c.mp4_ready, -c.kbps),
+        )
+    else:
+        best = best_copy
+    runner_up = best_encode if best is best_copy else best_copy
+    best.reason = _reason(best, runner_up, abs(steps))
+    return best
+
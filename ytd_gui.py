@@ -0,0 +1,477 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, scrolledtext
+import subprocess
+import os
+import queue
+import time
+from datetime import datetime
+
+from ytd_engine import (
+    DownloadEngine,
+    EVENT_LOG,
+    EVENT_RESOLVED,
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_DOWNLOADING,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_STATE_NAMES,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    format_rate,
+    format_rate_limit,
+)
+from ytd_metrics import STAGE_NAMES
+
+STARTUP_T0 = time.perf_counter()
+
+PRIORITY_NAMES = {"高": PRIORITY_HIGH, "普通": PRIORITY_NORMAL, "低": PRIORITY_LOW}
+PRIORITY_LABELS = {v: k for k, v in PRIORITY_NAMES.items()}
+
+
+class VideoDownloader:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("音视频下载器")
+        self.root.geometry("900x760")
+        self.root.resizable(True, True)
+        
+        self.engine = DownloadEngine(is_debug=True)
+        self.engine.add_listener(self._on_engine_event)
+        self.download_path = self.engine.download_path
+        self.resolved_url = ""
+        self.resolved_url_changed = False
+        self.queue_busy = False
+        self.batch_job_ids = set()
+        
+        self.log_queue = queue.Queue()
+        self.log_max_lines = self.get_log_max_lines()
+        self.log_batch_lines = 500
+        
+        self.tools_gate_open = False
+        self.first_paint_ms = None
+        self.ready_ms = None
+        
+        self.create_widgets()
+        
+        self.root.after_idle(self._mark_first_paint)
+        self.root.after(100, self._process_log_queue)
+        self.root.after(500, self._refresh_jobs)
+        self.engine.start_warmup()
+        self.root.after(50, self._poll_warmup)
+
+    def _on_engine_event(self, event, job, data):
+        if event == EVENT_LOG:
+            self.log(data["message"])
+        elif event == EVENT_RESOLVED:
+            self.resolved_url = data["url"]
+            self.resolved_url_changed = True
+
+    def _mark_first_paint(self):
+        self.first_paint_ms = (time.perf_counter() - STARTUP_T0) * 1000
+
+    def _poll_warmup(self):
+        if not self.tools_gate_open and self.engine.is_tools_ready():
+            self.tools_gate_open = True
+            self.download_btn.config(state=tk.NORMAL, text="开始下载")
+            resumed = self.engine.resume_jobs()
+            if resumed:
+                self.batch_job_ids.update(job.id for job in resumed)
+                self.queue_busy = True
+                self.log(f"已恢复 {len(resumed)} 个上次中断的任务")
+
+        if not all(f.done() for f in self.engine.warmup_futures.values()):
+            self.root.after(50, self._poll_warmup)
+            return
+
+        self.ready_ms = (time.perf_counter() - STARTUP_T0) * 1000
+        self.engine.wait_warmup()
+        self.log(self.get_startup_report())
+
+    def get_startup_report(self):
+        parts = [f"{name} {ms:.0f} ms" for name, ms in self.engine.warmup_timings.items()]
+        first_paint = f"{self.first_paint_ms:.0f} ms" if self.first_paint_ms is not None else "未知"
+        report = f"启动耗时：首次绘制 {first_paint}，就绪 {self.ready_ms:.0f} ms"
+        if parts:
+            report += f"（{'，'.join(parts)}）"
+        return report
+
+    def get_log_max_lines(self):
+        try:
+            return max(100, int(os.environ.get("YTD_LOG_MAX_LINES", "5000")))
+        except ValueError:
+            return 5000
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self.root, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        url_frame = ttk.LabelFrame(main_frame, text="下载链接（每行一个，可一次粘贴多个）", padding="5")
+        url_frame.pack(fill=tk.X, pady=5)
+        
+        self.url_text = tk.Text(url_frame, height=4, width=70)
+        self.url_text.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
+        
+        url_btn_frame = ttk.Frame(url_frame)
+        url_btn_frame.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        self.download_btn = ttk.Button(url_btn_frame, text="准备中...", command=self.start_download, state=tk.DISABLED)
+        self.download_btn.pack(fill=tk.X, pady=2)
+        
+        self.priority_var = tk.StringVar(value="普通")
+        priority_box = ttk.Combobox(url_btn_frame, textvariable=self.priority_var, values=list(PRIORITY_NAMES), state="readonly", width=8)
+        priority_box.pack(fill=tk.X, pady=2)
+        
+        self.audio_only_var = tk.BooleanVar(value=False)
+        audio_check = ttk.Checkbutton(url_btn_frame, text="仅音频", variable=self.audio_only_var)
+        audio_check.pack(fill=tk.X, pady=2)
+        
+        resolved_frame = ttk.LabelFrame(main_frame, text="解析地址", padding="5")
+        resolved_frame.pack(fill=tk.X, pady=5)
+        
+        self.resolved_var = tk.StringVar()
+        resolved_entry = ttk.Entry(resolved_frame, textvariable=self.resolved_var, width=60, state="readonly")
+        resolved_entry.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
+        
+        self.copy_btn = ttk.Button(resolved_frame, text="复制", command=self.copy_resolved_url)
+        self.copy_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        path_frame = ttk.LabelFrame(main_frame, text="下载路径", padding="5")
+        path_frame.pack(fill=tk.X, pady=5)
+        
+        path_label = ttk.Label(path_frame, text="如果你的默认下载路径改过请自定义路径:")
+        path_label.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        self.path_var = tk.StringVar(value=self.download_path)
+        path_entry = ttk.Entry(path_frame, textvariable=self.path_var, width=50)
+        path_entry.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
+        
+        browse_btn = ttk.Button(path_frame, text="浏览", command=self.browse_path)
+        browse_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        debug_frame = ttk.Frame(main_frame)
+        debug_frame.pack(fill=tk.X, pady=5, anchor=tk.W)
+        
+        self.debug_var = tk.BooleanVar(value=True)
+        debug_check = ttk.Checkbutton(debug_frame, text="调试模式", variable=self.debug_var, command=self.toggle_debug)
+        debug_check.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        jobs_label = ttk.Label(debug_frame, text="同时下载数:")
+        jobs_label.pack(side=tk.LEFT, padx=(15, 5), pady=5)
+        
+        self.max_jobs_var = tk.IntVar(value=self.engine.scheduler.max_workers)
+        jobs_spin = ttk.Spinbox(debug_frame, from_=1, to=16, width=4, textvariable=self.max_jobs_var, command=self.update_max_jobs)
+        jobs_spin.pack(side=tk.LEFT, padx=5, pady=5)
+        jobs_spin.bind("<FocusOut>", lambda e: self.update_max_jobs())
+        jobs_spin.bind("<Return>", lambda e: self.update_max_jobs())
+        
+        transcode_label = ttk.Label(debug_frame, text="同时转码数:")
+        transcode_label.pack(side=tk.LEFT, padx=(15, 5), pady=5)
+        
+        self.transcode_workers_var = tk.IntVar(value=self.engine.transcode_pool.max_workers)
+        transcode_spin = ttk.Spinbox(debug_frame, from_=1, to=16, width=4, textvariable=self.transcode_workers_var, command=self.update_transcode_workers)
+        transcode_spin.pack(side=tk.LEFT, padx=5, pady=5)
+        transcode_spin.bind("<FocusOut>", lambda e: self.update_transcode_workers())
+        transcode_spin.bind("<Return>", lambda e: self.update_transcode_workers())
+        
+        rate_label = ttk.Label(debug_frame, text="总限速(MiB/s，0 不限):")
+        rate_label.pack(side=tk.LEFT, padx=(15, 5), pady=5)
+        
+        self.rate_limit_var = tk.DoubleVar(value=round(self.engine.bandwidth_limit / 1024 / 1024, 1))
+        rate_spin = ttk.Spinbox(debug_frame, from_=0, to=1000, increment=0.5, width=6, textvariable=self.rate_limit_var, command=self.update_rate_limit)
+        rate_spin.pack(side=tk.LEFT, padx=5, pady=5)
+        rate_spin.bind("<FocusOut>", lambda e: self.update_rate_limit())
+        rate_spin.bind("<Return>", lambda e: self.update_rate_limit())
+        
+        queue_frame = ttk.LabelFrame(main_frame, text="任务队列", padding="5")
+        queue_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        columns = ("id", "state", "priority", "progress", "speed", "url")
+        self.job_tree = ttk.Treeview(queue_frame, columns=columns, show="headings", height=6)
+        for col, title, width in (
+            ("id", "编号", 50),
+            ("state", "状态", 70),
+            ("priority", "优先级", 60),
+            ("progress", "进度", 140),
+            ("speed", "速度（实际/分配）", 200),
+            ("url", "链接", 300),
+        ):
+            self.job_tree.heading(col, text=title)
+            self.job_tree.column(col, width=width, stretch=(col == "url"))
+        self.job_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.job_tree.bind("<<TreeviewSelect>>", lambda e: self._on_job_selected())
+        
+        queue_btn_frame = ttk.Frame(queue_frame)
+        queue_btn_frame.pack(fill=tk.X)
+        
+        self.stop_btn = ttk.Button(queue_btn_frame, text="终止所选", command=self.stop_selected_jobs)
+        self.stop_btn.pack(side=tk.LEFT, padx=5, pady=2)
+        
+        clear_btn = ttk.Button(queue_btn_frame, text="清除已结束", command=self.clear_finished_jobs)
+        clear_btn.pack(side=tk.LEFT, padx=5, pady=2)
+        
+        self.throughput_var = tk.StringVar(value="")
+        throughput_label = ttk.Label(queue_btn_frame, textvariable=self.throughput_var)
+        throughput_label.pack(side=tk.RIGHT, padx=5, pady=2)
+        
+        stage_frame = ttk.LabelFrame(main_frame, text="阶段耗时（所选任务）", padding="5")
+        stage_frame.pack(fill=tk.X, pady=5)
+        
+        stage_columns = ("stage", "count", "seconds", "share", "size", "errors")
+        self.stage_tree = ttk.Treeview(stage_frame, columns=stage_columns, show="headings", height=4)
+        for col, title, width in (
+            ("stage", "阶段", 110),
+            ("count", "次数", 50),
+            ("seconds", "耗时", 80),
+            ("share", "占任务时长", 90),
+            ("size", "数据量", 100),
+            ("errors", "失败", 50),
+        ):
+            self.stage_tree.heading(col, text=title)
+            self.stage_tree.column(col, width=width, stretch=(col == "stage"))
+        self.stage_tree.pack(fill=tk.X, padx=5, pady=5)
+        
+        log_frame = ttk.LabelFrame(main_frame, text="输出日志", padding="5")
+        log_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        self.log_text = scrolledtext.ScrolledText(log_frame, height=12, width=90)
+        self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.log_text.config(state=tk.DISABLED)
+
+    def browse_path(self):
+        path = filedialog.askdirectory(initialdir=self.download_path)
+        if path:
+            self.download_path = path
+            self.path_var.set(path)
+
+    def toggle_debug(self):
+        self.engine.is_debug = self.debug_var.get()
+
+    def update_max_jobs(self):
+        try:
+            value = int(self.max_jobs_var.get())
+        except (tk.TclError, ValueError):
+            value = self.engine.scheduler.max_workers
+        value = max(1, min(16, value))
+        self.max_jobs_var.set(value)
+        if value != self.engine.scheduler.max_workers:
+            self.engine.set_max_jobs(value)
+            self.log(f"同时下载数已设为 {value}")
+
+    def update_transcode_workers(self):
+        try:
+            value = int(self.transcode_workers_var.get())
+        except (tk.TclError, ValueError):
+            value = self.engine.transcode_pool.max_workers
+        value = max(1, min(16, value))
+        self.transcode_workers_var.set(value)
+        if value != self.engine.transcode_pool.max_workers:
+            self.engine.set_transcode_workers(value)
+            self.log(f"同时转码数已设为 {value}")
+
+    def update_rate_limit(self):
+        try:
+            value = float(self.rate_limit_var.get())
+        except (tk.TclError, ValueError):
+            value = self.engine.bandwidth_limit / 1024 / 1024
+        value = max(0.0, min(1000.0, value))
+        self.rate_limit_var.set(value)
+        limit = int(value * 1024 * 1024)
+        if limit != self.engine.bandwidth_limit:
+            self.engine.set_bandwidth_limit(limit)
+            self.log(f"总限速已设为 {format_rate_limit(limit)}")
+
+    def copy_resolved_url(self):
+        if self.resolved_url:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(self.resolved_url)
+            messagebox.showinfo("提示", "解析地址已复制到剪贴板")
+
+    def stop_selected_jobs(self):
+        selected = self.job_tree.selection()
+        if not selected:
+            messagebox.showinfo("提示", "请先在任务队列中选择要终止的任务")
+            return
+        for item in selected:
+            self.engine.stop_job(int(item))
+
+    def clear_finished_jobs(self):
+        for job_id, job in list(self.engine.scheduler.jobs.items()):
+            if job.is_finished:
+                self.engine.scheduler.jobs.pop(job_id, None)
+                if self.job_tree.exists(str(job_id)):
+                    self.job_tree.delete(str(job_id))
+
+    def _selected_job(self):
+        selected = self.job_tree.selection()
+        return self.engine.scheduler.jobs.get(int(selected[0])) if selected else None
+
+    def _on_job_selected(self):
+        self._show_selected_resolved_url()
+        self._refresh_stage_panel()
+
+    def _show_selected_resolved_url(self):
+        job = self._selected_job()
+        if job is not None:
+            self.resolved_url = job.resolved_url
+            self.resolved_var.set(job.resolved_url)
+
+    def _refresh_stage_panel(self):
+        job = self._selected_job()
+        rows = []
+        if job is not None and job.started_at:
+            wall = (job.finished_at or time.time()) - job.started_at
+            for stage, entry in job.stage_summary.items():
+                share = f"{entry['seconds'] / wall * 100:.0f}%" if wall > 0 else ""
+                size = f"{entry['bytes'] / 1024 / 1024:.1f} MiB" if entry["bytes"] else ""
+                rows.append((
+                    STAGE_NAMES.get(stage, stage),
+                    entry["count"],
+                    f"{entry['seconds']:.2f} 秒",
+                    share,
+                    size,
+                    entry["errors"] or "",
+                ))
+        items = self.stage_tree.get_children()
+        for index, values in enumerate(rows):
+            if index < len(items):
+                self.stage_tree.item(items[index], values=values)
+            else:
+                self.stage_tree.insert("", tk.END, values=values)
+        if len(items) > len(rows):
+            self.stage_tree.delete(*items[len(rows):])
+
+    def _format_rate(self, bytes_per_sec):
+        return format_rate(bytes_per_sec)
+
+    def _refresh_jobs(self):
+        if self.resolved_url_changed and not self.job_tree.selection():
+            self.resolved_url_changed = False
+            self.resolved_var.set(self.resolved_url)
+
+        for job in list(self.engine.scheduler.jobs.values()):
+            if job.total_bytes:
+                progress = f"{job.downloaded_bytes / 1024 / 1024:.1f}/{job.total_bytes / 1024 / 1024:.1f} MiB"
+                if job.fragment_count:
+                    progress += f"（{job.fragment_index or 0}/{job.fragment_count} 片）"
+            else:
+                progress = ""
+            tp = job.transcode_progress
+            if tp is not None and not tp.finished and job.transcode_processes:
+                progress = f"转码 {tp.percent:.0f}%" if tp.percent is not None else f"转码 {tp.out_time:.0f} 秒"
+                progress += f"（{tp.realtime_factor:.1f}x"
+                if tp.eta is not None:
+                    progress += f"，剩余 {int(tp.eta) // 60:02d}:{int(tp.eta) % 60:02d}"
+                progress += "）"
+            if job.state == JOB_QUEUED and job.prefetch is not None and job.prefetch.done():
+                progress = "已预取解析结果"
+            if job.entries_found:
+                progress = f"已发现 {job.entries_found} 项"
+                if job.child_ids:
+                    progress += f"，{len(job.child_ids)} 项加入队列"
+            if job.state in (JOB_FAILED, JOB_DONE) and job.error:
+                progress = job.error[:60]
+            speed = ""
+            if job.state == JOB_DOWNLOADING and job.speed:
+                speed = self._format_rate(job.speed)
+                if job.rate_limit:
+                    speed += f" / {self._format_rate(job.rate_limit)}"
+                if job.eta is not None:
+                    speed += f" 剩余 {int(job.eta) // 60:02d}:{int(job.eta) % 60:02d}"
+            values = (
+                job.id,
+                JOB_STATE_NAMES.get(job.state, job.state),
+                PRIORITY_LABELS.get(job.priority, job.priority),
+                progress,
+                speed,
+                f"[音频] {job.url}" if job.audio_only else job.url,
+            )
+            iid = str(job.id)
+            if self.job_tree.exists(iid):
+                self.job_tree.item(iid, values=values)
+            else:
+                self.job_tree.insert("", tk.END, iid=iid, values=values)
+
+        self._refresh_stage_panel()
+
+        speed, average, transferred = self.engine.throughput()
+        jobs = list(self.engine.scheduler.jobs.values())
+        finished = sum(1 for j in jobs if j.is_finished)
+        self.throughput_var.set(
+            f"完成 {finished}/{len(jobs)}，运行 {self.engine.scheduler.active_count}，"
+            f"转码 {self.engine.transcode_pool.active_count}+{self.engine.transcode_pool.pending_count}，"
+            f"总速度 {self._format_rate(speed)}，平均 {self._format_rate(average)}，"
+            f"已传输 {transferred / 1024 / 1024:.1f} MiB"
+        )
+
+        idle = self.engine.scheduler.is_idle()
+        if idle and self.queue_busy:
+            self.queue_busy = False
+            self._on_queue_drained()
+        self.root.after(500, self._refresh_jobs)
+
+    def _on_queue_drained(self):
+        batch = [
+            j for j in self.engine.scheduler.jobs.values()
+            if j.id in self.batch_job_ids or j.parent_id in self.batch_job_ids
+        ]
+        self.batch_job_ids = set()
+        done = sum(1 for j in batch if j.state == JOB_DONE)
+        failed = [j for j in batch if j.state == JOB_FAILED]
+        partial = [j for j in batch if j.state == JOB_DONE and j.error]
+        cancelled = sum(1 for j in batch if j.state == JOB_CANCELLED)
+        if not done and not failed:
+            return
+        files = sum(len(j.files) for j in batch)
+        self.log(f"队列已完成：成功 {done}，失败 {len(failed)}，终止 {cancelled}，共 {files} 个文件")
+        if failed or partial:
+            errors = "\n".join(f"#{j.id}: {j.error[-200:]}" for j in (failed + partial)[:5])
+            messagebox.showerror("部分任务失败", f"{len(failed)} 个任务失败，{len(partial)} 个任务部分失败:\n{errors}")
+        message = f"已处理完成 {done} 个任务\n点击'是'打开下载文件夹，'否'关闭提示"
+        if done and messagebox.askyesno("下载完成", message):
+            folder = self.download_path
+            if os.name == 'nt':
+                os.startfile(folder)
+            else:
+                subprocess.run(["open", folder])
+
+    def log(self, message):
+        self.log_queue.put(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+    
+    def _process_log_queue(self):
+        lines = []
+        try:
+            while len(lines) < self.log_batch_lines:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if lines:
+            self.log_text.config(state=tk.NORMAL)
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.log_max_lines
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.config(state=tk.DISABLED)
+
+        delay = 10 if not self.log_queue.empty() else 100
+        self.root.after(delay, self._process_log_queue)
+
+    def start_download(self):
+        urls = [u.strip() for u in self.url_text.get("1.0", tk.END).split() if u.strip()]
+        if not urls:
+            messagebox.showerror("错误", "请输入下载链接")
+            return
+        if not self.engine.is_tools_ready():
+            messagebox.showinfo("提示", "工具仍在准备中，请稍候")
+            return
+
+        priority = PRIORITY_NAMES.get(self.priority_var.get(), PRIORITY_NORMAL)
+        audio_only = self.audio_only_var.get()
+        for url in dict.fromkeys(urls):
+            job = self.engine.submit(url, self.download_path, priority=priority, audio_only=audio_only)
+            self.batch_job_ids.add(job.id)
+        self.queue_busy = True
+        self.url_text.delete("1.0", tk.END)
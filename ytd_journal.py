@@ -0,0 +1,197 @@
+import collections
+import json
+import os
+import threading
+import time
+import uuid
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+def new_journal_id():
+    return uuid.uuid4().hex[:12]
+
+
+def _try_lock(f):
+    """Non-blocking exclusive lock on an open file, held until it is closed."""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+class JobJournal:
+    """Append-only log of job stage transitions, replayed on startup to resume interrupted jobs.
+
+    Every event is one JSON line, flushed and fsynced as it is written, so a
+    crash loses at most the event that was being written. One process owns the
+    journal at a time (journal.lock): a second instance would otherwise resume
+    the first one's live jobs and compact away what it is still writing, so
+    it runs without a journal instead (``busy``).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, "journal.jsonl") if directory else None
+        self._lock = threading.Lock()
+        self._file = None
+        self._failed = False
+        self._owner = None
+        self.busy = False
+        if self.path:
+            self._claim()
+
+    def _claim(self):
+        try:
+            f = open(os.path.join(self.directory, "journal.lock"), "a")
+        except OSError:
+            self._failed = True
+            return
+        if _try_lock(f):
+            self._owner = f
+        else:
+            f.close()
+            self.busy = True
+
+    @property
+    def enabled(self):
+        return bool(self.path) and not self._failed and self._owner is not None
+
+    def _open_locked(self):
+        if self._file is None and self.enabled:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            except OSError:
+                self._failed = True
+        return self._file
+
+    def append(self, journal_id, event, **data):
+        if not journal_id:
+            return
+        line = json.dumps(dict(data, t=round(time.time(), 3), job=journal_id, ev=event), ensure_ascii=False)
+        with self._lock:
+            f = self._open_locked()
+            if f is None:
+                return
+            try:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                pass
+
+    def replay(self):
+        """Rebuild job state from the journal; returns the unfinished jobs in submit order."""
+        jobs = collections.OrderedDict()
+        if not self.enabled or not os.path.exists(self.path):
+            return []
+        with self._lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+            except OSError:
+                return []
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write.
+                continue
+            if not isinstance(event, dict):
+                continue
+            journal_id = event.get("job")
+            kind = event.get("ev")
+            if kind == "submit":
+                jobs[journal_id] = {
+                    "id": journal_id,
+                    "url": event.get("url"),
+                    "download_path": event.get("download_path"),
+                    "priority": event.get("priority"),
+                    "parent": event.get("parent"),
+                    "audio_only": bool(event.get("audio_only")),
+                    "state": "queued",
+                    "info_path": None,
+                    "info_time": None,
+                    "records": collections.OrderedDict(),
+                }
+                continue
+            job = jobs.get(journal_id)
+            if job is None:
+                continue
+            if kind == "state":
+                job["state"] = event.get("state")
+            elif kind == "info":
+                job["info_path"] = event.get("path")
+                job["info_time"] = event.get("t")
+            elif kind == "file":
+                record = event.get("record") or {}
+                if record.get("source"):
+                    job["records"][record["source"]] = dict(record, output=None)
+            elif kind == "output":
+                record = job["records"].get(event.get("source"))
+                if record is not None:
+                    record["output"] = event.get("output")
+        return [job for job in jobs.values() if job["state"] not in FINISHED_STATES]
+
+    def compact(self, jobs):
+        """Atomically rewrite the journal with just ``jobs`` (as returned by ``replay``).
+
+        Saved info files that none of them refers to are removed.
+        """
+        if not self.enabled:
+            return
+        lines = []
+        for job in jobs:
+            lines.append({
+                "ev": "submit", "job": job["id"], "url": job["url"], "download_path": job["download_path"],
+                "priority": job["priority"], "parent": job["parent"], "audio_only": job["audio_only"],
+            })
+            lines.append({"ev": "state", "job": job["id"], "state": job["state"]})
+            if job["info_path"]:
+                lines.append({"ev": "info", "job": job["id"], "path": job["info_path"], "t": job["info_time"]})
+            for record in job["records"].values():
+                lines.append({"ev": "file", "job": job["id"], "record": dict(record, output=None)})
+                if record.get("output"):
+                    lines.append({"ev": "output", "job": job["id"], "source": record["source"], "output": record["output"]})
+        keep = {os.path.abspath(job["info_path"]) for job in jobs if job["info_path"]}
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for line in lines:
+                        f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                return
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            for name in names:
+                path = os.path.join(self.directory, name)
+                if name.endswith(".info.json") and os.path.abspath(path) not in keep:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._owner is not None:
+                self._owner.close()
+                self._owner = None
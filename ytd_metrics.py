@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_STAGING = "staging"
+STAGE_RESOLVE = "resolve"
+STAGE_ENCODER_PROBE = "encoder_probe"
+STAGE_DOWNLOAD = "download"
+STAGE_MERGE = "merge"
+STAGE_TRANSCODE = "transcode"
+STAGE_CLEANUP = "cleanup"
+
+STAGE_NAMES = {
+    STAGE_STAGING: "工具暂存",
+    STAGE_RESOLVE: "解析",
+    STAGE_ENCODER_PROBE: "编码器探测",
+    STAGE_DOWNLOAD: "下载",
+    STAGE_MERGE: "合并/后处理",
+    STAGE_TRANSCODE: "转码",
+    STAGE_CLEANUP: "清理",
+}
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_CANCELLED = "cancelled"
+STATUS_RESTARTED = "restarted"
+
+# The span log is rotated to a single ".1" file once it grows past this.
+MAX_JSONL_BYTES = 16 * 1024 * 1024
+
+
+class Span:
+    __slots__ = (
+        "stage", "job_id", "parent", "detail", "started_at", "duration",
+        "bytes", "status", "exit_code", "_t0",
+    )
+
+    def __init__(self, stage, job_id=None, parent=None, detail=""):
+        self.stage = stage
+        self.job_id = job_id
+        self.parent = parent
+        self.detail = detail
+        self.started_at = time.time()
+        self.duration = None
+        self.bytes = 0
+        self.status = None
+        self.exit_code = None
+        self._t0 = time.perf_counter()
+
+    def set_exit(self, returncode):
+        self.exit_code = returncode
+        if self.status is None:
+            self.status = STATUS_OK if returncode == 0 else STATUS_ERROR
+
+    def as_dict(self):
+        return {
+            "time": round(self.started_at, 3),
+            "job": self.job_id,
+            "stage": self.stage,
+            "parent": self.parent,
+            "detail": self.detail,
+            "duration": round(self.duration or 0.0, 4),
+            "bytes": int(self.bytes or 0),
+            "status": self.status,
+            "exit_code": self.exit_code,
+        }
+
+
+def summarize_spans(spans):
+    """Per-stage totals for one job, in the order the stages first ran."""
+    stages = {}
+    for span in sorted(spans, key=lambda s: s.started_at):
+        if span.duration is None:
+            continue
+        entry = stages.setdefault(span.stage, {"count": 0, "seconds": 0.0, "bytes": 0, "errors": 0})
+        entry["count"] += 1
+        entry["seconds"] += span.duration
+        entry["bytes"] += int(span.bytes or 0)
+        if span.status == STATUS_ERROR:
+            entry["errors"] += 1
+    return stages
+
+
+class SpanRecorder:
+    def __init__(self, jsonl_path=None, prom_path=None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _open(self, stage, job, detail):
+        # Spans opened on the same thread inherit the job of the enclosing one.
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        if job is None and parent is not None:
+            job = parent[1]
+        return Span(stage, job.id if job is not None else None, parent[0].stage if parent else None, detail), job
+
+    def start(self, stage, job=None, detail="", parent=None):
+        """Open a span that is closed later with ``finish``, for stages that do not fit a ``with`` block."""
+        span = self._open(stage, job, detail)[0]
+        if parent is not None:
+            span.parent = parent.stage
+        return span
+
+    def finish(self, span, job=None, status=None):
+        span.duration = time.perf_counter() - span._t0
+        if status is not None:
+            span.status = status
+        elif span.status is None:
+            span.status = STATUS_OK
+        if job is not None:
+            job.spans.append(span)
+        self._record(span)
+        return span
+
+    @contextmanager
+    def span(self, stage, job=None, detail=""):
+        span, job = self._open(stage, job, detail)
+        stack = self._stack()
+        stack.append((span, job))
+        try:
+            yield span
+        except BaseException:
+            if span.status is None:
+                span.status = STATUS_ERROR
+            raise
+        finally:
+            stack.pop()
+            if span.status is None and job is not None and job.is_cancelled:
+                span.status = STATUS_CANCELLED
+            self.finish(span, job)
+
+    def _record(self, span):
+        with self._lock:
+            totals = self._totals.setdefault(span.stage, {"seconds": 0.0, "bytes": 0, "runs": {}})
+            totals["seconds"] += span.duration
+            totals["bytes"] += int(span.bytes or 0)
+            totals["runs"][span.status] = totals["runs"].get(span.status, 0) + 1
+            if self.jsonl_path:
+                self._append_jsonl(span)
+            if self.prom_path:
+                self._write_prometheus()
+
+    def _append_jsonl(self, span):
+        try:
+            if os.path.getsize(self.jsonl_path) > MAX_JSONL_BYTES:
+                os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        except OSError:
+            pass
+        try:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span.as_dict(), ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+
+    def _write_prometheus(self):
+        lines = [
+            "# HELP ytd_stage_seconds_total Wall time spent in each stage.",
+            "# TYPE ytd_stage_seconds_total counter",
+        ]
+        for stage, totals in sorted(self._totals.items()):
+            lines.append(f'ytd_stage_seconds_total{{stage="{stage}"}} {totals["seconds"]:.4f}')
+        lines += [
+            "# HELP ytd_stage_bytes_total Bytes moved by each stage.",
+            "# TYPE ytd_stage_bytes_total counter",
+        ]
+        for stage, totals in sorted(self._totals.items()):
+            lines.append(f'ytd_stage_bytes_total{{stage="{stage}"}} {totals["bytes"]}')
+        lines += [
+            "# HELP ytd_stage_runs_total Completed spans by stage and exit status.",
+            "# TYPE ytd_stage_runs_total counter",
+        ]
+        for stage, totals in sorted(self._totals.items()):
+            for status, count in sorted(totals["runs"].items()):
+                lines.append(f'ytd_stage_runs_total{{stage="{stage}",status="{status}"}} {count}')
+
+        tmp_path = self.prom_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.prom_path)
+        except Exception:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
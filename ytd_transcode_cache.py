@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Linux FICLONE ioctl: shares extents on btrfs/xfs instead of copying data.
+FICLONE = 0x40049409
+
+
+def partial_file_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        if size <= chunk_size * 3:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2 - chunk_size // 2, size - chunk_size):
+                f.seek(offset)
+                digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class TranscodeCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    def make_key(self, input_file, cmd, output_file, tool_fingerprint=None):
+        args = []
+        for arg in cmd[1:]:
+            if arg == input_file:
+                args.append("{input}")
+            elif arg == output_file:
+                args.append("{output}")
+            else:
+                args.append(arg)
+        digest = hashlib.sha256()
+        digest.update(partial_file_hash(input_file).encode("ascii"))
+        digest.update(json.dumps([args, tool_fingerprint]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ".mp4")
+
+    def fetch(self, key, output_file):
+        """Place the cached result for ``key`` at ``output_file``; returns the link method or None."""
+        if not self.enabled:
+            return None
+        entry = self._entry_path(key)
+        with self._lock:
+            if not os.path.exists(entry):
+                return None
+            try:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                method = link_or_copy(entry, output_file)
+                os.utime(entry, None)
+            except OSError:
+                return None
+        return method
+
+    def store(self, key, output_file):
+        if not self.enabled:
+            return False
+        try:
+            if os.path.getsize(output_file) > self.max_bytes:
+                return False
+        except OSError:
+            return False
+        entry = self._entry_path(key)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                link_or_copy(output_file, tmp)
+                os.replace(tmp, entry)
+            except OSError:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return False
+            self._evict_locked()
+        return True
+
+    def _evict_locked(self):
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".mp4"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
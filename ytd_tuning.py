@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+FRAGMENT_STEPS = (1, 2, 4, 8, 16)
+BUFFER_STEPS = ("16K", "64K", "256K", "1M")
+START_FRAGMENTS = 8
+START_BUFFER = "256K"
+# --concurrent-fragments does nothing for a download that is one request, so
+# those runs only tune the buffer, with their own history per host.
+DIRECT_FRAGMENTS = 1
+
+# Runs smaller than this say more about latency than throughput.
+MIN_SAMPLE_BYTES = 1024 * 1024
+MIN_SAMPLE_SECONDS = 1.0
+EWMA_ALPHA = 0.4
+ERROR_RATE_LIMIT = 0.1
+# A neighbouring setting must beat the current one by this much to take over.
+MOVE_THRESHOLD = 0.1
+# Every Nth run for a host re-checks a neighbour of the best setting.
+EXPLORE_EVERY = 8
+MAX_HOSTS = 500
+
+# yt-dlp output that means a request failed; with --no-warnings, fragments
+# dropped after exhausting retries only show up as "Skipping fragment".
+DOWNLOAD_ERROR_MARKERS = ("Retrying", "HTTP Error", "Got error", "Skipping fragment")
+
+
+def host_key(url):
+    try:
+        host = (urlparse(url).hostname or "").lower()
+    except ValueError:
+        host = ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host or "unknown"
+
+
+def is_download_error(line):
+    return any(marker in line for marker in DOWNLOAD_ERROR_MARKERS)
+
+
+def config_key(fragments, buffer_size):
+    return f"{fragments}/{buffer_size}"
+
+
+def entry_key(host, fragmented):
+    return host if fragmented else f"{host}#direct"
+
+
+class DownloadTuning:
+    __slots__ = ("host", "fragments", "buffer_size", "retries", "fragment_retries", "reason", "fragmented")
+
+    def __init__(self, host, fragments, buffer_size, retries=5, fragment_retries=10, reason="", fragmented=True):
+        self.host = host
+        self.fragments = fragments
+        self.buffer_size = buffer_size
+        self.retries = retries
+        self.fragment_retries = fragment_retries
+        self.reason = reason
+        self.fragmented = fragmented
+
+    @property
+    def key(self):
+        return config_key(self.fragments, self.buffer_size)
+
+    @property
+    def entry_key(self):
+        return entry_key(self.host, self.fragmented)
+
+    def ytdlp_args(self):
+        return [
+            "--concurrent-fragments", str(self.fragments),
+            "--fragment-retries", str(self.fragment_retries),
+            "--retries", str(self.retries),
+            "--buffer-size", self.buffer_size,
+        ]
+
+
+class DownloadTuner:
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        data = None
+        if self.path:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            data = {"version": self.VERSION, "hosts": {}}
+        self._data = data
+        return data
+
+    def _save(self):
+        if not self.path:
+            return
+        hosts = self._data["hosts"]
+        if len(hosts) > MAX_HOSTS:
+            for host in sorted(hosts, key=lambda h: hosts[h].get("updated", 0))[:len(hosts) - MAX_HOSTS]:
+                del hosts[host]
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _score(stats):
+        return stats["speed"] * (1 - min(stats["error_rate"], 0.9))
+
+    @staticmethod
+    def _neighbours(fragments, buffer_size, prefer_fewer, fragmented=True):
+        fi = FRAGMENT_STEPS.index(fragments)
+        bi = BUFFER_STEPS.index(buffer_size)
+        fewer = [(FRAGMENT_STEPS[fi - 1], buffer_size)] if fragmented and fi > 0 else []
+        more = [(FRAGMENT_STEPS[fi + 1], buffer_size)] if fragmented and fi + 1 < len(FRAGMENT_STEPS) else []
+        bigger = [(fragments, BUFFER_STEPS[bi + 1])] if bi + 1 < len(BUFFER_STEPS) else []
+        smaller = [(fragments, BUFFER_STEPS[bi - 1])] if bi > 0 else []
+        if prefer_fewer:
+            return fewer + smaller
+        return more + bigger + fewer + smaller
+
+    @staticmethod
+    def _parse_key(key):
+        fragments, _, buffer_size = str(key).partition("/")
+        try:
+            fragments = int(fragments)
+        except ValueError:
+            return None
+        if fragments in FRAGMENT_STEPS and buffer_size in BUFFER_STEPS:
+            return fragments, buffer_size
+        return None
+
+    def _neighbour_state(self, configs, current, fragmented):
+        throttled = configs[current]["error_rate"] > ERROR_RATE_LIMIT
+        neighbours = self._neighbours(current[0], current[1], throttled, fragmented)
+        untested = [c for c in neighbours if c not in configs]
+        return throttled, neighbours, untested
+
+    def choose(self, host, fragmented=True):
+        key = entry_key(host, fragmented)
+        with self._lock:
+            hosts = self._load()["hosts"]
+            entry = hosts.get(key) or {}
+            configs = {}
+            for config_text, stats in (entry.get("configs") or {}).items():
+                config = self._parse_key(config_text)
+                if config is not None and isinstance(stats, dict) and (fragmented or config[0] == DIRECT_FRAGMENTS):
+                    configs[config] = stats
+
+            start = (START_FRAGMENTS if fragmented else DIRECT_FRAGMENTS, START_BUFFER)
+            current = self._parse_key(entry.get("current")) or start
+            if not fragmented and current[0] != DIRECT_FRAGMENTS:
+                current = start
+            if current not in configs:
+                return DownloadTuning(
+                    host, current[0], current[1], reason="初始值" if not configs else "探索", fragmented=fragmented
+                )
+
+            # Hill climb: try each neighbour of the current setting once, then move
+            # only when one is clearly better (or the current one is throttled), so
+            # noise between near-equal settings does not keep the tuner wandering.
+            throttled, neighbours, untested = self._neighbour_state(configs, current, fragmented)
+            if not untested and neighbours:
+                better = max(neighbours, key=lambda c: self._score(configs[c]))
+                if throttled or self._score(configs[better]) > self._score(configs[current]) * (1 + MOVE_THRESHOLD):
+                    current = better
+                    hosts[key]["current"] = config_key(*current)
+                    self._save()
+                    throttled, neighbours, untested = self._neighbour_state(configs, current, fragmented)
+
+        retries, fragment_retries = (10, 20) if throttled else (5, 10)
+        # Re-checks skip settings that were throttled so they cannot fail a real job.
+        healthy = [c for c in neighbours if configs.get(c, {}).get("error_rate", 1.0) <= ERROR_RATE_LIMIT]
+        if untested:
+            choice, reason = untested[0], "探索"
+        elif healthy and entry.get("runs", 0) % EXPLORE_EVERY == 0:
+            choice, reason = min(healthy, key=lambda c: configs[c].get("updated", 0)), "复查"
+        else:
+            choice, reason = current, "出错较多" if throttled else "历史最佳"
+        return DownloadTuning(host, choice[0], choice[1], retries, fragment_retries, reason, fragmented)
+
+    def expected_speed(self, host, fragmented=True):
+        """Smoothed speed of the host's current setting in bytes/s, or None before any sample."""
+        with self._lock:
+            entry = self._load()["hosts"].get(entry_key(host, fragmented)) or {}
+            configs = entry.get("configs") or {}
+            stats = configs.get(entry.get("current"))
+            if not isinstance(stats, dict):
+                stats = max(
+                    (c for c in configs.values() if isinstance(c, dict)),
+                    key=lambda c: c.get("speed") or 0,
+                    default=None,
+                )
+        if not stats or not stats.get("speed"):
+            return None
+        return stats["speed"]
+
+    def record(self, tuning, total_bytes, seconds, errors, requests, failed=False):
+        """Fold one run into the stats of its setting; returns its speed, or None when it tells nothing.
+
+        ``errors`` counts transport errors (``is_download_error`` lines). A
+        failed run without any is an extractor or availability failure - a
+        private, removed or geo-blocked video - and is not the host's fault.
+        """
+        if failed and not errors:
+            return None
+        if failed:
+            errors = max(errors, requests, 1)
+        elif not errors and (total_bytes < MIN_SAMPLE_BYTES or seconds < MIN_SAMPLE_SECONDS):
+            return None
+        speed = total_bytes / seconds if seconds > 0 else 0.0
+        error_rate = min(1.0, errors / max(1, requests))
+        with self._lock:
+            hosts = self._load()["hosts"]
+            entry = hosts.setdefault(tuning.entry_key, {"runs": 0, "configs": {}})
+            entry.setdefault("current", tuning.key)
+            entry["runs"] = entry.get("runs", 0) + 1
+            entry["updated"] = time.time()
+            stats = entry.setdefault("configs", {}).get(tuning.key)
+            if stats is None:
+                stats = {"runs": 0, "speed": speed, "error_rate": error_rate}
+            else:
+                stats["speed"] += EWMA_ALPHA * (speed - stats["speed"])
+                stats["error_rate"] += EWMA_ALPHA * (error_rate - stats["error_rate"])
+            stats["runs"] += 1
+            stats["updated"] = time.time()
+            entry["configs"][tuning.key] = stats
+            self._save()
+        return speed